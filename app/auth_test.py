@@ -0,0 +1,206 @@
+# Copyright 2018 Google LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the authentication middleware.
+"""
+
+
+from unittest.mock import MagicMock
+
+import flask
+import pytest
+
+from blueprints.healthz import blueprint as healthz
+from middlewares import auth
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    Replaces time.time in the middleware with a settable clock.
+    """
+    now = [1000.0]
+    monkeypatch.setattr(auth.time, 'time', lambda: now[0])
+    return now
+
+
+def test_token_cache_expires_entries_at_the_token_exp(clock):
+    """
+    Should serve a verified token until its exp claim and not after.
+    """
+    cache = auth.TokenCache(max_entries=8)
+    cache.put('token', {'uid': 'u1'}, expires_at=1060)
+    assert cache.get('token') == {'uid': 'u1'}
+    clock[0] = 1060
+    assert cache.get('token') is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_token_cache_evicts_the_least_recently_used_token():
+    """
+    Should keep at most max_entries tokens, dropping the least recently used.
+    """
+    cache = auth.TokenCache(max_entries=2)
+    cache.put('a', {'uid': 'a'}, expires_at=float('inf'))
+    cache.put('b', {'uid': 'b'}, expires_at=float('inf'))
+    cache.get('a')
+    cache.put('c', {'uid': 'c'}, expires_at=float('inf'))
+    assert cache.get('b') is None
+    assert cache.get('a') == {'uid': 'a'}
+    assert cache.get('c') == {'uid': 'c'}
+
+
+def test_token_cache_counts_hits_and_misses():
+    """
+    Should count lookups for /healthz/stats.
+    """
+    cache = auth.TokenCache(max_entries=2)
+    cache.get('token')
+    cache.put('token', {'uid': 'u1'}, expires_at=float('inf'))
+    cache.get('token')
+    cache.get('token')
+    assert cache.stats() == {'hits': 2, 'misses': 1, 'hit_ratio': 2 / 3, 'entries': 1}
+
+
+def test_verified_tokens_are_served_from_the_cache(monkeypatch):
+    """
+    Should verify a token with Firebase once and then serve it from the cache.
+    """
+    monkeypatch.setattr(auth, 'token_cache', auth.TokenCache(max_entries=8))
+    verify = MagicMock(return_value={'uid': 'u1', 'email': 'a@b.c', 'exp': float('inf')})
+    monkeypatch.setattr(auth.auth, 'verify_id_token', verify)
+    assert auth.verify_firebase_id_token('token')['uid'] == 'u1'
+    assert auth.verify_firebase_id_token('token')['uid'] == 'u1'
+    assert verify.call_count == 1
+
+
+def test_cert_prefetch_is_skipped_without_the_verifier_request(monkeypatch):
+    """
+    Should log and skip the prefetch when firebase_admin internals move.
+    """
+    monkeypatch.setattr(auth.auth, '_get_client', lambda app: object(), raising=False)
+    thread = MagicMock()
+    monkeypatch.setattr(auth.threading, 'Thread', thread)
+    assert auth.start_cert_prefetch() is False
+    thread.assert_not_called()
+
+
+def make_healthz_client():
+    app = flask.Flask(__name__)
+    app.register_blueprint(healthz.healthz_page)
+    return app.test_client()
+
+
+def test_stats_are_off_without_a_token(monkeypatch):
+    """
+    Should not serve /healthz/stats unless HEALTHZ_STATS_TOKEN is set.
+    """
+    monkeypatch.setattr(healthz, 'HEALTHZ_STATS_TOKEN', None)
+    assert make_healthz_client().get('/healthz/stats').status_code == 404
+
+
+def test_stats_require_the_bearer_token(monkeypatch):
+    """
+    Should answer 401 without the right bearer token.
+    """
+    monkeypatch.setattr(healthz, 'HEALTHZ_STATS_TOKEN', 'secret')
+    client = make_healthz_client()
+    assert client.get('/healthz/stats').status_code == 401
+    assert client.get('/healthz/stats', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert client.get('/healthz').status_code == 200
+
+
+@pytest.fixture
+def session_mode(monkeypatch, clock):
+    """
+    Turns on session mode with a mocked verify_firebase_id_token, and
+    returns the mock. Calls with check_revoked=True are recorded too.
+    """
+    monkeypatch.setattr(auth, 'AUTH_SESSION_MODE', True)
+    monkeypatch.setattr(auth, 'AUTH_SESSION_TTL', 300)
+    monkeypatch.setattr(auth, 'AUTH_REVOCATION_CHECK_INTERVAL', 900)
+    users = {'token-1': {'uid': 'u1'}, 'token-2': {'uid': 'u2'}}
+    verify = MagicMock(side_effect=lambda token, check_revoked=False: dict(users.get(token, {})))
+    monkeypatch.setattr(auth, 'verify_firebase_id_token', verify)
+    return verify
+
+
+@pytest.fixture
+def session_app():
+    app = flask.Flask(__name__)
+    app.secret_key = 'test'
+    return app
+
+
+def test_session_serves_the_context_until_its_ttl(session_app, session_mode, clock):
+    """
+    Should verify once, serve the session for AUTH_SESSION_TTL and verify
+    again (without a revocation check) once it has expired.
+    """
+    with session_app.test_request_context():
+        assert auth.resolve_auth_context('token-1') == {'uid': 'u1'}
+        assert session_mode.call_count == 2  # First sign-in checks revocation.
+
+        clock[0] += 299
+        assert auth.resolve_auth_context('token-1') == {'uid': 'u1'}
+        assert session_mode.call_count == 2
+
+        clock[0] += 1
+        assert auth.resolve_auth_context('token-1') == {'uid': 'u1'}
+        assert session_mode.call_count == 3
+        assert session_mode.call_args.kwargs.get('check_revoked', False) is False
+
+
+def test_session_rechecks_revocation_at_the_interval(session_app, session_mode, clock):
+    """
+    Should check revocation again once AUTH_REVOCATION_CHECK_INTERVAL has
+    passed since the last check, and drop the session if it fails.
+    """
+    with session_app.test_request_context():
+        auth.resolve_auth_context('token-1')
+        clock[0] += 900
+        session_mode.reset_mock()
+        session_mode.side_effect = lambda token, check_revoked=False: (
+            {} if check_revoked else {'uid': 'u1'})
+        assert auth.resolve_auth_context('token-1') == {}
+        assert session_mode.call_args.kwargs['check_revoked'] is True
+        assert 'auth' not in flask.session
+
+
+def test_session_is_not_used_for_a_different_token(session_app, session_mode, clock):
+    """
+    Should ignore a session bound to another token, verifying the new one
+    (with a revocation check, as the user changed) or dropping the session
+    if it is invalid.
+    """
+    with session_app.test_request_context():
+        auth.resolve_auth_context('token-1')
+        session_mode.reset_mock()
+        assert auth.resolve_auth_context('token-2') == {'uid': 'u2'}
+        assert session_mode.call_args.kwargs['check_revoked'] is True
+
+        assert auth.resolve_auth_context('forged') == {}
+        assert 'auth' not in flask.session
+
+
+def test_session_is_left_alone_without_session_mode(session_app, monkeypatch):
+    """
+    Should not touch the session (and so not add Vary: Cookie) when
+    session mode is off.
+    """
+    monkeypatch.setattr(auth, 'AUTH_SESSION_MODE', False)
+    with session_app.test_request_context():
+        auth.forget_session()
+        assert not flask.session.accessed
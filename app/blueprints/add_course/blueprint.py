@@ -21,16 +21,14 @@ This module is the Flask blueprint for the add course page (/add_course).
 from dataclasses import asdict
 import os
 import random
-import requests
 
 from flask import Blueprint, redirect, render_template, url_for
 
-from helpers import eventing, auth, courses
+from helpers import catalog, eventing, courses, gateway
 from middlewares.auth import auth_required
 from middlewares.form_validation import AddCourseForm, course_form_validation_required
 
 PUBSUB_TOPIC_NEW_PRODUCT = os.environ.get('PUBSUB_TOPIC_NEW_PRODUCT')
-API_GATEWAY = os.environ.get('API_GATEWAY_URL')
 
 add_course_page = Blueprint('add_course_page', __name__)
 
@@ -82,31 +80,25 @@ def process(auth_context, form):
         ratingsCount=str(random.randint(1, 1000))
     )
     new_course_dict = asdict(new_course)
-    
-    api_gateway_url = API_GATEWAY + "/courses"
-    jwt_cred = auth.generate_creds(
-        sa_keyfile="keyfile.json",
-        sa_email=os.environ.get('JWT_EMAIL'),
-        audience=API_GATEWAY
-    )
-    response = auth.make_authorized_post_request(
-        jwt_cred,
-        url=api_gateway_url,
-        data=new_course_dict
-    )
-    
-    if response.ok:
-        email = auth_context.get('email')
-        eventing.stream_event(
-            topic_name=PUBSUB_TOPIC_NEW_PRODUCT,
-            event_type='new-product-sub',
-            event_context={
-                'to': email,
-                'subject': 'Successfully Added Course to Syscourse',
-                'text': 'course uploaded to syscourse successfully.'
-            }
-        )
-        return redirect(url_for('course_page.display'))
-    else:
+
+    try:
+        response_data = gateway.client.create_course(new_course_dict)
+    except gateway.GatewayError:
         # Handle the case where the request to the API Gateway fails
         return "Error: Failed to add course", 500
+    catalog.invalidate()
+
+    email = auth_context.get('email')
+    eventing.stream_event(
+        topic_name=PUBSUB_TOPIC_NEW_PRODUCT,
+        event_type='new-product-sub',
+        event_context={
+            'to': email,
+            'subject': 'Successfully Added Course to Syscourse',
+            'text': 'course uploaded to syscourse successfully.',
+            # Lets the replicas invalidate their catalog caches.
+            'product_type': 'course',
+            'product_id': response_data.get('doc_id'),
+        }
+    )
+    return redirect(url_for('course_page.display'))
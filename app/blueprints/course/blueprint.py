@@ -16,20 +16,30 @@
 """
 This module is the Flask blueprint for the cart page (/cart).
 """
-import os
-import requests
+from flask import Blueprint, g, render_template, request
 
-from flask import Blueprint, render_template, request
-
-from helpers import courses, resources, auth
+from helpers import catalog, courses, resources, auth, gateway
 from middlewares.auth import auth_required, auth_optional
+from middlewares.page_cache import anonymous_page_cache
 
 
 course_page = Blueprint("course_page", __name__)
-API_GATEWAY = os.environ.get('API_GATEWAY_URL')
+
+
+def catalog_snapshots():
+    """
+    Returns the course and resource list snapshots of this request, fetched
+    once and concurrently (if they are not both cached already), for both
+    the page's ETag and the page itself.
+    """
+    if "catalog_snapshots" not in g:
+        g.catalog_snapshots = auth.fan_out(catalog.course_snapshot, catalog.resource_snapshot)
+    return g.catalog_snapshots
+
 
 @course_page.route("/")
 @auth_optional
+@anonymous_page_cache(lambda: "".join(snapshot.version for snapshot in catalog_snapshots()))
 def display(auth_context):
     """
     View function for displaying all of the course.
@@ -40,31 +50,16 @@ def display(auth_context):
     Output:
         Rendered HTML page.
     """
-    jwt_cred = auth.generate_creds(
-        sa_keyfile="keyfile.json",
-        sa_email=os.environ.get('JWT_EMAIL'),
-        audience=API_GATEWAY
-    )
-    api_gateway_url = API_GATEWAY + "/courses"
-    response = auth.make_authorized_get_request(
-        jwt_cred,
-        url=api_gateway_url
-    )
-    course_items = response.json()
-    
-    api_gateway_url = API_GATEWAY + "/resources"
-    response = auth.make_authorized_get_request(
-        jwt_cred,
-        url=api_gateway_url
-    )
-    resource_items = response.json()
+    course_items, resource_items = catalog_snapshots()
 
+    # The catalog partials come from the fragment cache; only the page
+    # around them is rendered per request.
+    signed_in = bool(auth_context)
     return render_template(
         "main.html",
-        courses=course_items,
-        resources=resource_items,
+        course_catalog=catalog.render_course_catalog(course_items, courses.BUCKET, signed_in),
+        resource_catalog=catalog.render_resource_catalog(resource_items, courses.BUCKET, signed_in),
         auth_context=auth_context,
-        bucket=courses.BUCKET,
     )
 
 
@@ -84,25 +79,22 @@ def display_specific(auth_context):
     course_id = request.args.get("course_id")
 
     if course_id:
-        # Fetch course details based on course_id
-        jwt_cred = auth.generate_creds(
-            sa_keyfile="keyfile.json",
-            sa_email=os.environ.get('JWT_EMAIL'),
-            audience=API_GATEWAY
-        )
-        api_gateway_url = API_GATEWAY + "/courses/" + course_id
-        response = auth.make_authorized_get_request(
-            jwt_cred,
-            url=api_gateway_url
-        )
-        course = response.json()
-        
-        api_gateway_url = API_GATEWAY + "/resources/course/" + course_id
-        response = auth.make_authorized_get_request(
-            jwt_cred,
-            url=api_gateway_url
-        )
-        resource_list = response.json()
+        # Unknown IDs (stale links, crawlers) end here without upstream calls.
+        if not catalog.may_exist('course', course_id):
+            return "Course not found", 404
+        # Take the course and its resources from the cached catalog if it
+        # has the course, and both from the gateway otherwise.
+        detail = catalog.course_detail(course_id)
+        if detail is None:
+            detail = auth.fan_out(
+                lambda: gateway.client.get_course(course_id),
+                lambda: gateway.client.list_resources(
+                    course_id=course_id, fields=catalog.RESOURCE_LIST_FIELDS),
+            )
+        course, resource_list = detail
+        if course is None:
+            catalog.record_missing('course', course_id)
+            return "Course not found", 404
         return render_template(
             "course.html",
             course=course,
@@ -1,33 +1,25 @@
 import os
-from helpers import auth
+from helpers import catalog
 from middlewares.auth import auth_required, auth_optional
+from middlewares.page_cache import anonymous_page_cache
 
 from flask import Blueprint, render_template
 
 all_course_page = Blueprint('all_course_page', __name__)
-API_GATEWAY = os.environ.get('API_GATEWAY_URL')
 
 @all_course_page.route('/all_course')
 @auth_optional
+@anonymous_page_cache(lambda: catalog.course_snapshot().version)
 def display(auth_context):
     """
     View function for displaying the courses page.
     """
-    api_gateway_url = API_GATEWAY + "/courses"
-    jwt_cred = auth.generate_creds(
-        sa_keyfile="keyfile.json",
-        sa_email=os.environ.get('JWT_EMAIL'),
-        audience=API_GATEWAY
-    )
-    response = auth.make_authorized_get_request(
-        jwt_cred,
-        url=api_gateway_url
-    )
-    course_items = response.json()
+    course_items = catalog.course_snapshot()
     
     return render_template(
         "all_course_page.html",
-        courses=course_items,
+        course_catalog=catalog.render_course_catalog(
+            course_items, os.environ.get('GCS_BUCKET'), bool(auth_context)
+        ),
         auth_context=auth_context,
-        bucket=os.environ.get('GCS_BUCKET'),
     )
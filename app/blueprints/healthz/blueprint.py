@@ -18,8 +18,16 @@ This module is the Flask blueprint for the product catalog page (/).
 """
 
 
-from flask import Blueprint, jsonify
+import hmac
+import os
 
+from flask import Blueprint, abort, jsonify, request
+
+from helpers import catalog, gateway
+from middlewares.auth import token_cache
+
+# Bearer token required by /healthz/stats; the endpoint is off without it.
+HEALTHZ_STATS_TOKEN = os.environ.get('HEALTHZ_STATS_TOKEN')
 
 healthz_page = Blueprint('healthz_page', __name__)
 
@@ -30,4 +38,24 @@ def health_check():
     Health check endpoint.
     Returns a simple HTTP 200 response to indicate the application is running.
     """
-    return jsonify({"status": "ok"}), 200
\ No newline at end of file
+    return jsonify({"status": "ok"}), 200
+
+
+@healthz_page.route('/healthz/stats')
+def stats():
+    """
+    Exposes in-process counters (circuit breakers, coalesced gateway calls,
+    catalog and ID token caches) of the worker that serves the request.
+    Requires "Authorization: Bearer <HEALTHZ_STATS_TOKEN>"; answers 404
+    when HEALTHZ_STATS_TOKEN is not set.
+    """
+    if not HEALTHZ_STATS_TOKEN:
+        abort(404)
+    expected = f'Bearer {HEALTHZ_STATS_TOKEN}'.encode()
+    if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), expected):
+        abort(401)
+    return jsonify({
+        "gateway": gateway.client.stats(),
+        "catalog": catalog.stats(),
+        "id_token_cache": token_cache.stats(),
+    }), 200
@@ -17,16 +17,13 @@
 This module is the Flask blueprint for the resource page (/resource).
 """
 
-import requests
-import os
 from flask import Blueprint, render_template, request
 
-from helpers import auth, resources
+from helpers import catalog, gateway, resources
 from middlewares.auth import auth_required, auth_optional
 
 
 resource_page = Blueprint("resource_page", __name__)
-API_GATEWAY = os.environ.get('API_GATEWAY_URL')
 
 @resource_page.route('/resource', methods=['GET'])
 @auth_required
@@ -44,18 +41,14 @@ def display_specific(auth_context):
     resource_id = request.args.get('resource_id')    
     
     if resource_id:
+        # Unknown IDs (stale links, crawlers) end here without upstream calls.
+        if not catalog.may_exist('resource', resource_id):
+            return "Resource not found", 404
         # Fetch course details based on course_id
-        api_gateway_url = API_GATEWAY + "/resources/" + resource_id
-        jwt_cred = auth.generate_creds(
-            sa_keyfile="keyfile.json",
-            sa_email=os.environ.get('JWT_EMAIL'),
-            audience=API_GATEWAY
-        )
-        response = auth.make_authorized_get_request(
-            jwt_cred,
-            url=api_gateway_url,
-        )
-        resource = response.json()
+        resource = gateway.client.get_resource(resource_id)
+        if resource is None:
+            catalog.record_missing('resource', resource_id)
+            return "Resource not found", 404
         return render_template('resource.html', resource=resource, auth_context=auth_context, bucket=resources.BUCKET)
     else:
         return "Course ID is required", 400
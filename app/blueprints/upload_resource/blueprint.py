@@ -20,13 +20,12 @@ This module is the Flask blueprint for the upload resource page (/upload_resourc
 
 from dataclasses import asdict
 import os
-import requests
 
 from flask import Blueprint, redirect, render_template, url_for, request, current_app, flash
 from werkzeug.utils import secure_filename
 
 
-from helpers import eventing, auth, resources
+from helpers import catalog, eventing, gateway, resources
 from middlewares.auth import auth_required
 from middlewares.form_validation import (
     ResourceUploadForm,
@@ -34,7 +33,6 @@ from middlewares.form_validation import (
 )
 
 PUBSUB_TOPIC_NEW_PRODUCT = os.environ.get('PUBSUB_TOPIC_NEW_PRODUCT')
-API_GATEWAY = os.environ.get('API_GATEWAY_URL')
 
 upload_resource_page = Blueprint("upload_resource_page", __name__)
 
@@ -54,22 +52,8 @@ def display(auth_context):
 
     # Prepares the upload resourse form.
     # See middlewares/form_validation.py for more information.
-    api_gateway_url = API_GATEWAY + "/courses"
-    jwt_cred = auth.generate_creds(
-        sa_keyfile="keyfile.json",
-        sa_email=os.environ.get('JWT_EMAIL'),
-        audience=API_GATEWAY
-    )
-    response = auth.make_authorized_get_request(
-        jwt_cred,
-        url=api_gateway_url
-    )
-    list_course = response.json()
-    
     form = ResourceUploadForm()
-    form.course_id.choices = [
-        (course["course_id"], course["title"]) for course in list_course
-    ]
+    form.course_id.choices = catalog.course_choices()
     return render_template("upload_resource.html", auth_context=auth_context, form=form)
 
 
@@ -89,12 +73,6 @@ def process(auth_context, form):
     Output:
        Rendered HTML page.
     """
-    jwt_cred = auth.generate_creds(
-        sa_keyfile="keyfile.json",
-        sa_email=os.environ.get('JWT_EMAIL'),
-        audience=API_GATEWAY
-    )
-    
     file = request.files.get('resourceFile')
     if not file or file.filename == '':
         # Flash message and redirect if no file is selected
@@ -106,32 +84,13 @@ def process(auth_context, form):
     files = {'filepond': (filename, file, file.content_type)}
     
     # Send the file to the Cloud Function
-    api_gateway_url = API_GATEWAY + "/upload_image"
-    response = auth.make_authorized_post_files_request(
-        jwt_cred,
-        url=api_gateway_url,
-        files=files
-    )
-    if response.status_code != 200:
+    try:
+        response_data = gateway.client.upload_file(files)
+    except gateway.GatewayError:
         # Flash message and redirect if cloud function fails
         flash('Error uploading file', 'error')
         return redirect(url_for("upload_resource_page.display", _anchor='form'))
-    
-    # If the request was successful, extract the response data
-    response_data = response.json()
-     
-    # get list of courses
-    api_gateway_url = API_GATEWAY + "/courses"
-    response = auth.make_authorized_get_request(
-        jwt_cred,
-        url=api_gateway_url
-    )
-    list_course = response.json()
-    
-    form.course_id.choices = [
-        (course["course_id"], course["title"]) for course in list_course
-    ]
-    
+
     # Create the Resource object with the data from the response
     upload_resource = resources.Resource(
         title=form.title.data,
@@ -145,26 +104,27 @@ def process(auth_context, form):
     )
 
     new_upload_resource = asdict(upload_resource)
-    
-    api_gateway_url = API_GATEWAY + "/resources"
-    response = auth.make_authorized_post_request(
-        jwt_cred,
-        url=api_gateway_url,
-        data=new_upload_resource
-    )
-    
-    if response.ok:
-        email = auth_context.get('email')
-        eventing.stream_event(
-            topic_name=PUBSUB_TOPIC_NEW_PRODUCT,
-            event_type='new-product-sub',
-            event_context={
-                'to': email,
-                'subject': 'Successfully Uploaded Resource to Syscourse',
-                'text': 'resource uploaded to syscourse.'
-            }
-        )
-        return redirect(url_for("course_page.display"))
-    else:
+
+    try:
+        response_data = gateway.client.create_resource(new_upload_resource)
+    except gateway.GatewayError:
         # Handle the case where the request to the API Gateway fails
         return "Error: Failed to add course", 500
+    catalog.invalidate()
+
+    email = auth_context.get('email')
+    eventing.stream_event(
+        topic_name=PUBSUB_TOPIC_NEW_PRODUCT,
+        event_type='new-product-sub',
+        event_context={
+            'to': email,
+            'subject': 'Successfully Uploaded Resource to Syscourse',
+            'text': 'resource uploaded to syscourse.',
+            # Lets the replicas invalidate their catalog caches.
+            'product_type': 'resource',
+            # The Firestore document ID, as for courses; not the upload's ID.
+            'product_id': response_data.get('doc_id'),
+            'course_id': upload_resource.course_id,
+        }
+    )
+    return redirect(url_for("course_page.display"))
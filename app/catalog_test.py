@@ -0,0 +1,287 @@
+# Copyright 2018 Google LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the catalog cache.
+"""
+
+
+from unittest.mock import MagicMock
+
+from helpers import catalog
+
+
+def make_cache(**kwargs):
+    # A refresh interval this long keeps the refresher out of the tests
+    # unless they wake it up.
+    return catalog.TTLCache(ttl=60, stale_ttl=300, refresh_interval=3600, **kwargs)
+
+
+def test_fresh_entries_are_served_from_cache():
+    """
+    Should call the loader once and count the following lookups as hits.
+    """
+    cache = make_cache()
+    loader = MagicMock(return_value=['course'])
+    assert cache.get('courses', loader) == ['course']
+    assert cache.get('courses', loader) == ['course']
+    assert loader.call_count == 1
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['hit_ratio']) == (1, 1, 0.5)
+    assert 'courses' in stats['entries']
+
+
+def test_stale_entries_are_served_while_revalidating():
+    """
+    Should return the stale value at once and refresh it in the background.
+    """
+    cache = make_cache()
+    loader = MagicMock(side_effect=[['old'], ['new']])
+    cache.get('courses', loader)
+    cache._entries['courses'].fetched_at -= 61
+    assert cache.get('courses', loader) == ['old']
+    assert cache.stats()['stale_hits'] == 1
+    cache._wakeup.set()
+    for _ in range(1000):
+        if cache.stats()['refreshes']:
+            break
+        cache._refresher.join(0.01)
+    assert cache.get('courses', loader) == ['new']
+
+
+def test_expired_entries_are_reloaded():
+    """
+    Should load in the request once an entry is past its stale window.
+    """
+    cache = make_cache()
+    loader = MagicMock(side_effect=[['old'], ['new']])
+    cache.get('courses', loader)
+    cache._entries['courses'].fetched_at -= 361
+    assert cache.get('courses', loader) == ['new']
+    assert cache.stats()['misses'] == 2
+
+
+def test_invalidate_and_size_bound():
+    """
+    Should drop invalidated entries and evict the least recently used.
+    """
+    cache = make_cache(max_entries=2)
+    cache.get('a', lambda: 1)
+    cache.get('b', lambda: 2)
+    cache.get('a', lambda: 1)
+    cache.get('c', lambda: 3)
+    assert set(cache.stats()['entries']) == {'a', 'c'}
+    cache.invalidate('a')
+    assert set(cache.stats()['entries']) == {'c'}
+    cache.invalidate()
+    assert cache.stats()['entries'] == {}
+
+
+def test_shared_tier_serves_and_invalidates_all_replicas():
+    """
+    Should share loaded values between replicas and drop them everywhere
+    when one replica invalidates the catalog.
+    """
+    server = catalog.FakeRedisServer()
+    replicas = []
+    for _ in range(2):
+        shared = catalog.SharedTier(catalog.FakeRedis(server), ttl=60)
+        cache = make_cache()
+        shared.listen(cache.invalidate)
+        replicas.append((cache, shared))
+    (cache_a, shared_a), (cache_b, shared_b) = replicas
+    loader = MagicMock(side_effect=[['old'], ['new']])
+
+    def read(cache, shared):
+        return cache.get('courses', lambda: shared.get_or_load('courses', loader))
+
+    assert read(cache_a, shared_a) == ['old']
+    assert read(cache_b, shared_b) == ['old']
+    assert loader.call_count == 1
+    assert shared_b.stats()['hits'] == 1
+
+    shared_a.invalidate()
+    assert cache_b.stats()['entries'] == {}
+    assert read(cache_b, shared_b) == ['new']
+    assert read(cache_a, shared_a) == ['new']
+    assert loader.call_count == 2
+
+
+def test_shared_entry_age_counts_towards_the_local_ttl():
+    """
+    Should expire a value copied from the shared tier when it would have
+    expired had this replica loaded it, not a full ttl later.
+    """
+    import json
+    import time
+
+    client = catalog.FakeRedis()
+    client.set('catalog:0:courses', json.dumps({'value': ['a'], 'loaded_at': time.time() - 50}))
+    shared = catalog.SharedTier(client, ttl=60)
+    cache = make_cache()
+    loader = MagicMock(return_value=['b'])
+
+    assert cache.get('courses', lambda: shared.get_or_load('courses', loader)) == ['a']
+    assert 50 <= cache.stats()['entries']['courses']['age'] < 51
+    assert cache.peek('courses', fresh=True) is not None
+    assert loader.call_count == 0
+
+
+def test_new_product_events_invalidate_matching_entries(monkeypatch):
+    """
+    Should drop only the lists a new course or resource changes.
+    """
+    cache = make_cache()
+    monkeypatch.setattr(catalog.helpers, 'cache', cache)
+    for key in ('courses', 'resources', 'resources:c1', 'resources:c2'):
+        cache.get(key, lambda: [])
+
+    event = b'{"event_type": "new-product-sub", "event_context": {"product_type": "resource", "course_id": "c1"}}'
+    catalog.apply_event(catalog.events.parse_event(event))
+    assert set(cache.stats()['entries']) == {'courses', 'resources:c2'}
+
+    catalog.apply_event({'product_type': 'course', 'product_id': 'c3'})
+    assert set(cache.stats()['entries']) == {'resources:c2'}
+    assert catalog.events.parse_event(b'{"event_type": "payment_processed"}') is None
+
+
+def test_fragment_cache_renders_once_per_version():
+    """
+    Should reuse rendered partials until the catalog version changes.
+    """
+    import flask
+    import jinja2
+
+    app = flask.Flask(__name__)
+    app.jinja_loader = jinja2.DictLoader({
+        'part.html': '{% for c in courses %}{{ c }},{% endfor %}{{ bucket }}:{{ auth_context }}',
+    })
+    fragments = catalog.helpers.FragmentCache(max_entries=8)
+    v1 = catalog.Snapshot(['a'], 'v1')
+    with app.app_context():
+        assert fragments.render('part.html', v1, 'b', False, 'courses') == 'a,b:False'
+        assert fragments.render('part.html', v1, 'b', False, 'courses') == 'a,b:False'
+        fragments.render('part.html', v1, 'b', True, 'courses')
+        fragments.render('part.html', catalog.Snapshot(['a', 'c'], 'v2'), 'b', False, 'courses')
+    assert fragments.stats() == {'hits': 1, 'misses': 3, 'entries': 3}
+
+
+def test_unknown_ids_are_rejected_from_the_cached_list(monkeypatch):
+    """
+    Should reject IDs missing from the cached list or reported missing, and
+    let everything through while the list is not cached.
+    """
+    cache = make_cache()
+    monkeypatch.setattr(catalog.helpers, 'cache', cache)
+    monkeypatch.setattr(catalog.helpers, '_resource_bloom', (None, None))
+    monkeypatch.setattr(catalog.helpers, 'negative_cache', catalog.helpers.NegativeCache(30))
+    monkeypatch.setattr(catalog.helpers, '_events_subscribed', True)
+    monkeypatch.setattr(catalog.helpers, '_membership_stats', {'list_rejections': 0, 'negative_hits': 0})
+    assert catalog.may_exist('course', 'c1')
+
+    cache.get('courses', lambda: [{'course_id': 'c1'}, {'course_id': 'c2'}])
+    assert catalog.may_exist('course', 'c1')
+    assert not catalog.may_exist('course', 'bogus')
+
+    catalog.record_missing('course', 'c2')
+    assert not catalog.may_exist('course', 'c2')
+    catalog.apply_event({'product_type': 'course', 'product_id': 'c3'})
+    assert catalog.may_exist('course', 'c2')
+
+    cache.get('resources', lambda: [{'resource_id': 'r1'}])
+    assert catalog.may_exist('resource', 'r1')
+    assert not catalog.may_exist('resource', 'bogus')
+    assert catalog.stats()['membership']['list_rejections'] == 2
+
+
+def test_unknown_ids_pass_when_the_list_may_be_outdated(monkeypatch):
+    """
+    Should not reject IDs from a list that other replicas' writes do not
+    invalidate, or that is past its TTL, as it may predate them.
+    """
+    cache = make_cache()
+    monkeypatch.setattr(catalog.helpers, 'cache', cache)
+    monkeypatch.setattr(catalog.helpers, '_resource_bloom', (None, None))
+    monkeypatch.setattr(catalog.helpers, 'negative_cache', catalog.helpers.NegativeCache(30))
+    monkeypatch.setattr(catalog.helpers, 'shared', None)
+    monkeypatch.setattr(catalog.helpers, '_events_subscribed', False)
+    cache.get('courses', lambda: [{'course_id': 'c1'}])
+    assert catalog.may_exist('course', 'new')
+
+    monkeypatch.setattr(catalog.helpers, '_events_subscribed', True)
+    assert not catalog.may_exist('course', 'new')
+    cache.ttl = 0  # The list is now stale (but still served).
+    assert catalog.may_exist('course', 'new')
+
+
+def test_course_choices_follow_the_cached_list(monkeypatch):
+    """
+    Should derive the select options and the ID set from the cached list,
+    confirming IDs it lacks with the gateway.
+    """
+    cache = make_cache()
+    monkeypatch.setattr(catalog.helpers, 'cache', cache)
+    monkeypatch.setattr(catalog.helpers, 'negative_cache', catalog.helpers.NegativeCache(30))
+    courses = [{'course_id': 'c1', 'title': 'One'}, {'course_id': 'c2', 'title': 'Two'}]
+    monkeypatch.setattr(catalog.helpers.gateway.client, 'list_courses', lambda fields=None: courses)
+    get_course = MagicMock(return_value=None)
+    monkeypatch.setattr(catalog.helpers.gateway.client, 'get_course', get_course)
+
+    assert catalog.course_choices() == [('c1', 'One'), ('c2', 'Two')]
+    assert catalog.is_course('c2')
+    assert not catalog.is_course('c3')
+    assert not catalog.is_course('c3')
+    assert get_course.call_count == 1  # The miss is remembered.
+    get_course.return_value = {'course_id': 'c4'}
+    assert catalog.is_course('c4')  # Added on another replica.
+
+    courses = courses + [{'course_id': 'c3', 'title': 'Three'}]
+    cache.invalidate()
+    assert catalog.is_course('c3')
+
+
+def test_course_detail_is_served_from_the_index(monkeypatch):
+    """
+    Should look up a course's resources in the cached lists and the course
+    itself in the detail cache, projected to COURSE_DETAIL_FIELDS, and
+    defer to the gateway when the lists are not cached or lack the course.
+    """
+    cache = make_cache()
+    monkeypatch.setattr(catalog.helpers, 'cache', cache)
+    monkeypatch.setattr(catalog.helpers, 'details', make_cache())
+    get_course = MagicMock(side_effect=lambda course_id: {
+        'course_id': course_id, 'description': '...', 'price': 10})
+    monkeypatch.setattr(catalog.helpers.gateway.client, 'get_course', get_course)
+    assert catalog.course_detail('c1') is None
+
+    cache.get('courses', lambda: [{'course_id': 'c1'}, {'course_id': 'c2'}])
+    cache.get('resources', lambda: [
+        {'resource_id': 'r1', 'course_id': 'c1'},
+        {'resource_id': 'r2', 'course_id': 'c2'},
+        {'resource_id': 'r3', 'course_id': 'c1'},
+    ])
+    course, resources = catalog.course_detail('c1')
+    assert course == {'course_id': 'c1', 'description': '...'}
+    assert [r['resource_id'] for r in resources] == ['r1', 'r3']
+    assert catalog.course_detail('c1')[0] == course
+    assert get_course.call_count == 1
+    assert catalog.course_detail('c2')[1] == [{'resource_id': 'r2', 'course_id': 'c2'}]
+    assert catalog.course_detail('c9') is None
+    assert get_course.call_count == 2
+
+    catalog.invalidate()
+    cache.get('courses', lambda: [{'course_id': 'c1'}])
+    cache.get('resources', lambda: [])
+    catalog.course_detail('c1')
+    assert get_course.call_count == 3
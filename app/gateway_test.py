@@ -0,0 +1,389 @@
+# Copyright 2018 Google LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the API Gateway client.
+"""
+
+
+import itertools
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+import requests
+
+from helpers import deadlines, gateway
+
+
+def make_response(status_code, body=None, headers=None):
+    response = MagicMock()
+    response.status_code = status_code
+    response.ok = 200 <= status_code < 400
+    response.json.return_value = body
+    response.headers = headers or {}
+    return response
+
+
+@pytest.fixture
+def get_request(monkeypatch):
+    """
+    Replaces the authorized GET helper used by the client with a mock.
+    """
+    mock = MagicMock()
+    monkeypatch.setattr(gateway.helpers.auth, 'make_authorized_get_request', mock)
+    monkeypatch.setattr(gateway.helpers.auth, 'get_creds', MagicMock())
+    return mock
+
+
+@pytest.fixture
+def client():
+    return gateway.GatewayClient(base_url='https://gateway.test', max_retries=2,
+                                 backoff_base=0, breaker_threshold=3)
+
+
+def test_get_retries_transient_failures(client, get_request):
+    """
+    Should retry 5xx responses and connection errors on GETs.
+    """
+    get_request.side_effect = [
+        make_response(503),
+        requests.ConnectionError(),
+        make_response(200, [{'course_id': 'c1'}]),
+    ]
+    assert client.list_courses() == [{'course_id': 'c1'}]
+    assert get_request.call_count == 3
+
+
+def test_get_gives_up_after_max_retries(client, get_request):
+    """
+    Should raise a GatewayError once the retries are exhausted.
+    """
+    get_request.return_value = make_response(500)
+    with pytest.raises(gateway.GatewayError):
+        client.list_resources()
+    assert get_request.call_count == 3
+
+
+def test_get_not_found_returns_none(client, get_request):
+    """
+    Should map a 404 on a detail endpoint to None without retrying.
+    """
+    get_request.return_value = make_response(404)
+    assert client.get_course('missing') is None
+    assert get_request.call_count == 1
+
+
+def test_get_revalidates_with_etag(client, get_request):
+    """
+    Should send If-None-Match and reuse the stored body on 304.
+    """
+    get_request.side_effect = [
+        make_response(200, [{'course_id': 'c1'}], headers={'ETag': '"v1"'}),
+        make_response(304),
+    ]
+    assert client.list_courses() == [{'course_id': 'c1'}]
+    assert client.list_courses() == [{'course_id': 'c1'}]
+    assert get_request.call_args.kwargs['headers']['If-None-Match'] == '"v1"'
+    assert client.stats()['etag']['revalidated'] == 1
+
+
+def test_list_requests_only_the_given_fields(client, get_request):
+    """
+    Should ask the helpers for a projection with ?fields=.
+    """
+    get_request.return_value = make_response(200, [{'course_id': 'c1', 'title': 'One'}])
+    client.list_courses(fields=('course_id', 'title'))
+    assert get_request.call_args.args[1] == 'https://gateway.test/courses?fields=course_id,title&limit=500'
+
+
+def test_list_follows_the_next_page_token(client, get_request):
+    """
+    Should read a list page by page until no X-Next-Page-Token is sent.
+    """
+    client.page_size = 2
+    get_request.side_effect = [
+        make_response(200, [{'course_id': 'c1'}, {'course_id': 'c2'}],
+                      headers={'X-Next-Page-Token': 'a/b='}),
+        make_response(200, [{'course_id': 'c3'}]),
+    ]
+    assert client.list_resources(course_id='c0') == [
+        {'course_id': 'c1'}, {'course_id': 'c2'}, {'course_id': 'c3'}]
+    assert [call.args[1] for call in get_request.call_args_list] == [
+        'https://gateway.test/resources/course/c0?limit=2',
+        'https://gateway.test/resources/course/c0?limit=2&page_token=a%2Fb%3D',
+    ]
+
+
+def test_list_pages_stop_at_the_deadline(client, get_request, monkeypatch):
+    """
+    Should not request another page once the request's deadline has passed.
+    """
+    clock = [0.0]
+    sent = []
+    monkeypatch.setattr(deadlines.helpers.time, 'monotonic', lambda: clock[0])
+
+    def page(*args, **kwargs):
+        # As make_authorized_get_request, which caps its timeout first.
+        deadlines.timeout(kwargs.get('timeout'))
+        sent.append(args[1])
+        clock[0] += 1
+        return make_response(200, [{'course_id': 'c1'}], headers={'X-Next-Page-Token': 't'})
+    get_request.side_effect = page
+    token = deadlines.start(1.5)
+    try:
+        with pytest.raises(deadlines.DeadlineExceeded):
+            client.list_courses()
+    finally:
+        deadlines.reset(token)
+    assert len(sent) == 2
+
+
+def test_get_stops_retrying_at_the_deadline(client, get_request):
+    """
+    Should not sleep through a backoff that outlasts the request's deadline.
+    """
+    get_request.return_value = make_response(503)
+    client._backoff = lambda attempt: 5
+    token = deadlines.start(1)
+    try:
+        with pytest.raises(gateway.GatewayError):
+            client.list_courses()
+    finally:
+        deadlines.reset(token)
+    assert get_request.call_count == 1
+
+
+def test_deadline_caps_timeouts_and_follows_bound_calls():
+    """
+    Should cap timeouts to the remaining budget, including in other threads.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    assert deadlines.timeout((3.05, 10)) == (3.05, 10)
+    token = deadlines.start(1)
+    try:
+        connect, read = deadlines.timeout((3.05, 10))
+        assert connect <= 1 and read <= 1
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            assert executor.submit(deadlines.remaining).result() is None
+            assert executor.submit(deadlines.bind(deadlines.remaining)).result() <= 1
+    finally:
+        deadlines.reset(token)
+    assert deadlines.remaining() is None
+
+
+def test_breaker_opens_and_fails_fast(client, get_request):
+    """
+    Should stop calling a route once its circuit breaker opens.
+    """
+    get_request.return_value = make_response(502)
+    with pytest.raises(gateway.GatewayError):
+        client.list_courses()
+    get_request.reset_mock()
+    with pytest.raises(gateway.CircuitOpenError):
+        client.list_courses()
+    assert get_request.call_count == 0
+    assert client.stats()['breakers']['GET /courses'] == 'open'
+
+
+def test_breaker_half_open_trial_closes_on_success():
+    """
+    Should let one trial call through after the reset timeout.
+    """
+    breaker = gateway.CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == gateway.CircuitBreaker.CLOSED
+
+
+def test_batch_get_chunks_ids(client, monkeypatch):
+    """
+    Should send de-duplicated IDs in chunks and index the results by ID.
+    """
+    post = MagicMock(side_effect=lambda creds, url, data, timeout=None: make_response(
+        200, {'courses': [{'course_id': i} for i in data['ids'] if i != 'gone'],
+              'missing': ['gone'] if 'gone' in data['ids'] else []}
+    ))
+    monkeypatch.setattr(gateway.helpers.auth, 'make_authorized_post_request', post)
+    monkeypatch.setattr(gateway.helpers.auth, 'get_creds', MagicMock())
+    ids = ['c%d' % i for i in range(gateway.BATCH_GET_MAX_IDS + 1)] + ['c0', 'gone']
+    found = client.batch_get_courses(ids)
+    assert post.call_count == 2
+    assert set(found) == set(ids) - {'gone'}
+
+
+def test_batch_loader_sends_one_batch_per_window():
+    """
+    Should fetch all keys queued before the first result in a single call,
+    and each key only once.
+    """
+    batch_fn = MagicMock(side_effect=lambda keys: {k: k.upper() for k in keys if k != 'x'})
+    loader = gateway.BatchLoader(batch_fn, window=0)
+    first, second, missing = loader.load('a'), loader.load('b'), loader.load('x')
+    assert loader.load('a') is first
+    assert [first.result(), second.result(), missing.result()] == ['A', 'B', None]
+    assert loader.load_many(['b', 'a']) == ['B', 'A']
+    batch_fn.assert_called_once_with(['a', 'b', 'x'])
+    assert loader.stats() == {'batches': 1, 'keys_loaded': 3}
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    """
+    Should run one call for concurrent callers of the same key.
+    """
+    single_flight = gateway.SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    results = []
+
+    def slow_call():
+        started.set()
+        release.wait()
+        return ['shared']
+
+    leader = threading.Thread(target=lambda: results.append(single_flight.do('k', slow_call)))
+    leader.start()
+    started.wait()
+    followers = [
+        threading.Thread(target=lambda: results.append(single_flight.do('k', slow_call)))
+        for _ in range(3)
+    ]
+    for follower in followers:
+        follower.start()
+    while single_flight.stats()['coalesced'] < 3:
+        pass
+    release.set()
+    for thread in [leader] + followers:
+        thread.join()
+
+    assert results == [['shared']] * 4
+    assert single_flight.stats() == {'executed': 1, 'coalesced': 3, 'in_flight': 0}
+
+
+def make_hedge_policy(**kwargs):
+    options = dict(min_delay=0.01, initial_delay=0.01, burst=1, max_ratio=0.5,
+                   min_samples=4, max_workers=4)
+    options.update(kwargs)
+    return gateway.HedgePolicy(['GET /courses'], **options)
+
+
+def test_hedge_delay_follows_the_latency_percentile():
+    """
+    Should use initial_delay until min_samples, then the percentile of the
+    observed latencies, never below min_delay.
+    """
+    policy = make_hedge_policy(percentile=50, min_delay=0.05, initial_delay=0.5)
+    assert policy.delay('GET /courses') == 0.5
+    for seconds in (0.1, 0.2, 0.3, 0.4):
+        policy.record_latency('GET /courses', seconds)
+    assert policy.delay('GET /courses') == 0.3
+    for _ in range(8):
+        policy.record_latency('GET /courses', 0.01)
+    assert policy.delay('GET /courses') == 0.05
+
+
+def slow_then_fast(results, release):
+    """
+    Returns an fn whose first call waits for release and returns results[0],
+    and whose second call returns results[1] at once.
+    """
+    calls = itertools.count()
+    lock = threading.Lock()
+
+    def fn():
+        with lock:
+            n = next(calls)
+        if n == 0:
+            release.wait(5)
+        return results[n]
+    return fn
+
+
+def test_hedge_wins_are_counted():
+    """
+    Should return the hedge's result when it finishes first, and count it.
+    """
+    release = threading.Event()
+    policy = make_hedge_policy()
+    assert policy.call('GET /courses', slow_then_fast(['primary', 'hedge'], release)) == 'hedge'
+    release.set()
+    assert policy.stats() == {'requests': 1, 'hedged': 1, 'hedge_rate': 1.0,
+                              'hedge_wins': 1, 'budget_exhausted': 0}
+
+
+def test_hedges_are_capped_by_the_token_budget():
+    """
+    Should stop hedging once the burst is spent, earning max_ratio of a
+    hedge per request.
+    """
+    release = threading.Event()
+    policy = make_hedge_policy(burst=1, max_ratio=0.5)
+    policy.call('GET /courses', slow_then_fast(['primary', 'hedge'], release))
+    release.set()  # Later first attempts return without waiting.
+    assert policy.stats()['hedged'] == 1
+
+    release.clear()
+    threading.Timer(0.05, release.set).start()
+    assert policy.call('GET /courses', slow_then_fast(['primary', 'hedge'], release)) == 'primary'
+    assert policy.stats()['budget_exhausted'] == 1
+    assert policy.stats()['hedged'] == 1
+
+
+def test_retryable_result_waits_for_the_other_attempt():
+    """
+    Should not return a retryable result while the other attempt may
+    still succeed.
+    """
+    release = threading.Event()
+    policy = make_hedge_policy(is_retryable=lambda result: result == 503)
+    fn = slow_then_fast([200, 503], release)
+    threading.Timer(0.05, release.set).start()
+    assert policy.call('GET /courses', fn) == 200
+    assert policy.stats()['hedge_wins'] == 0
+
+
+def test_retryable_result_is_returned_if_both_attempts_fail():
+    """
+    Should fall back to the retryable result when the other attempt raises.
+    """
+    release = threading.Event()
+    policy = make_hedge_policy(is_retryable=lambda result: result == 503)
+    fn = slow_then_fast([requests.ConnectionError(), 503], release)
+
+    def attempt():
+        result = fn()
+        if isinstance(result, Exception):
+            raise result
+        return result
+    threading.Timer(0.05, release.set).start()
+    assert policy.call('GET /courses', attempt) == 503
+
+
+def test_losing_attempt_is_closed():
+    """
+    Should close the losing attempt's response once it finishes, so its
+    pooled connection is released.
+    """
+    release = threading.Event()
+    primary, hedge = make_response(200), make_response(200)
+    policy = make_hedge_policy()
+    assert policy.call('GET /courses', slow_then_fast([primary, hedge], release)) is hedge
+    primary.close.assert_not_called()
+    release.set()
+    policy.executor.shutdown(wait=True)
+    primary.close.assert_called_once()
+    hedge.close.assert_not_called()
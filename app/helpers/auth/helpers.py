@@ -1,97 +1,291 @@
 #!/usr/bin/env python
+import calendar
+import concurrent.futures
+import logging
+import os
 import requests
+import requests.adapters
+import threading
 import time
 import google.auth.crypt
 import google.auth.jwt
-from google.auth.transport.requests import AuthorizedSession
+
+from helpers import deadlines
+
+logger = logging.getLogger(__name__)
+
+# Re-sign a token this many seconds before it expires. Must stay above
+# google-auth's own refresh threshold (a few minutes), otherwise request
+# threads would still end up re-signing tokens themselves.
+JWT_REFRESH_MARGIN = int(os.environ.get('JWT_REFRESH_MARGIN', '600'))
+
+# Size the connection pool to the number of request threads of a worker so
+# that concurrent views never queue behind each other for a connection.
+WORKER_THREADS = int(os.environ.get('WORKER_THREADS', '16'))
+GATEWAY_POOL_CONNECTIONS = int(os.environ.get('GATEWAY_POOL_CONNECTIONS', '4'))
+GATEWAY_POOL_MAXSIZE = int(os.environ.get('GATEWAY_POOL_MAXSIZE', WORKER_THREADS))
+GATEWAY_CONNECT_TIMEOUT = float(os.environ.get('GATEWAY_CONNECT_TIMEOUT', '3.05'))
+GATEWAY_READ_TIMEOUT = float(os.environ.get('GATEWAY_READ_TIMEOUT', '10'))
+GATEWAY_TIMEOUT = (GATEWAY_CONNECT_TIMEOUT, GATEWAY_READ_TIMEOUT)
+FAN_OUT_WORKERS = int(os.environ.get('FAN_OUT_WORKERS', WORKER_THREADS))
+
+
+class CredentialManager:
+    """
+    Process-wide cache of signed gateway JWTs.
+
+    The service account key is parsed once, one signed token is kept per
+    audience, and a daemon thread re-signs each token shortly before it
+    expires so that request threads only ever read a ready token.
+    :param sa_keyfile:        Service account key file
+    :param refresh_margin:    Seconds before expiry at which to re-sign
+    """
+
+    def __init__(self, sa_keyfile, refresh_margin=JWT_REFRESH_MARGIN):
+        self._sa_keyfile = sa_keyfile
+        self._refresh_margin = refresh_margin
+        self._base_creds = None
+        self._creds = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._refresher = None
+
+    def get(self, audience):
+        """
+        Returns signed credentials for the audience, signing them on first use.
+        :param audience:      Token recipient
+        """
+        creds = self._creds.get(audience)
+        if creds is not None:
+            return creds
+        with self._lock:
+            creds = self._creds.get(audience)
+            if creds is None:
+                creds = self._sign(audience)
+                self._creds[audience] = creds
+                self._ensure_refresher()
+        return creds
+
+    def _sign(self, audience):
+        if self._base_creds is None:
+            self._base_creds = google.auth.jwt.Credentials.from_service_account_file(
+                self._sa_keyfile
+            )
+        creds = self._base_creds.with_claims(audience=audience)
+        creds.refresh(None)
+        return creds
+
+    def _ensure_refresher(self):
+        if self._refresher is None or not self._refresher.is_alive():
+            self._refresher = threading.Thread(
+                target=self._refresh_loop, name='jwt-refresher', daemon=True
+            )
+            self._refresher.start()
+        else:
+            self._wakeup.set()
+
+    def _refresh_due_at(self, creds):
+        return calendar.timegm(creds.expiry.utctimetuple()) - self._refresh_margin
+
+    def _refresh_loop(self):
+        while True:
+            now = time.time()
+            for audience, creds in list(self._creds.items()):
+                if self._refresh_due_at(creds) <= now:
+                    try:
+                        # Swap in a freshly signed object instead of mutating
+                        # the one request threads may be reading from.
+                        self._creds[audience] = self._sign(audience)
+                    except Exception:
+                        logger.exception("Error refreshing JWT for %s", audience)
+            next_due = min(
+                (self._refresh_due_at(creds) for creds in self._creds.values()),
+                default=now + self._refresh_margin,
+            )
+            # Retry failed refreshes after a short pause rather than spinning.
+            self._wakeup.wait(max(next_due - time.time(), 5))
+            self._wakeup.clear()
+
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+_credential_managers = {}
+_credential_managers_pid = None
+_credential_managers_lock = threading.Lock()
+
+
+def get_credential_manager(sa_keyfile="keyfile.json"):
+    """
+    Returns the credential manager of the current worker process for a key
+    file. A fresh manager is created after a fork so that each worker owns
+    its own refresher thread.
+    :param sa_keyfile:    Service account key file
+    """
+    global _credential_managers_pid
+    with _credential_managers_lock:
+        if _credential_managers_pid != os.getpid():
+            _credential_managers.clear()
+            _credential_managers_pid = os.getpid()
+        manager = _credential_managers.get(sa_keyfile)
+        if manager is None:
+            manager = CredentialManager(sa_keyfile)
+            _credential_managers[sa_keyfile] = manager
+        return manager
+
+
+def get_creds(audience, sa_keyfile="keyfile.json"):
+    """
+    Returns cached, already signed credentials for the audience.
+    :param audience:      Token recipient
+    :param sa_keyfile:    Service account key file
+    """
+    return get_credential_manager(sa_keyfile).get(audience)
+
+
 def generate_creds(sa_keyfile, sa_email, audience):
     """
     Here we generate a signed JSON Web Token using a IAM Service Account.
+    The token is served from the per-process CredentialManager, so the key
+    file is only parsed and the token only signed once per expiry period.
     :param sa_keyfile:    Service account key file
-    :param sa_email:      Service Account
+    :param sa_email:      Service Account (the key file's own is used)
     :param audience:      Token recipient
     """
-    # Set current time to `now` so we can reuse the timestamp later
-    now = int(time.time())
-    # Build payload
-    payload = {
-        'iat': now,
-        # expires after 'expiry_length' seconds.
-        "exp": now + 3600,
-        # iss must match 'issuer' in the security definition in your
-        # OpenAPI2 / API Gateway configuration. This value should be
-        # service account email.
-        'iss': sa_email,
-        # aud must be either your endpoints service name, or match the value
-        # specified as the 'x-google-audience' in the OpenAPI2 / API Gateway.
-        'aud':  audience,
-        # sub and email should match the service account's email address
-        'sub': sa_email,
-        'email': sa_email
-    }
-    # Sign with IAM Service Account JSON keyfile (either method works)
-    # See https://google-auth.readthedocs.io/en/master/reference/google.auth.jwt.html
-    # For this we can use google.auth.crypt.RSASigner or google.auth.jwt.Credentials
-    # signer = google.auth.crypt.RSASigner.from_service_account_file(sa_keyfile)
-    # jwt = google.auth.jwt.encode(signer, payload)
-    jwt = google.auth.jwt.Credentials.from_service_account_file(
-          sa_keyfile,
-          audience=audience,
-    )
-    
-    return jwt
-def make_authorized_get_request(jwt_credentials, url):
+    return get_creds(audience, sa_keyfile=sa_keyfile)
+
+def get_session():
+    """
+    Returns the long-lived HTTP session of the current worker process.
+    Connections to the API Gateway are kept alive and pooled, so only the
+    first call per connection pays for the TCP and TLS handshakes.
+    """
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        with _session_lock:
+            if _session is None or _session_pid != os.getpid():
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=GATEWAY_POOL_CONNECTIONS,
+                    pool_maxsize=GATEWAY_POOL_MAXSIZE,
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+                _session_pid = os.getpid()
+    return _session
+
+
+def _authorized_headers(jwt_credentials, method, url, headers):
+    # Applies the bearer token, re-signing only if it has somehow expired;
+    # CredentialManager normally keeps it fresh in the background.
+    jwt_credentials.before_request(None, method, url, headers)
+    return headers
+
+
+def make_authorized_get_request(jwt_credentials, url, timeout=None, headers=None):
     """
     Makes an authorized request to the endpoint
     :param jwt_credentials:     token
     :param url:                 request URL
+    :param timeout:             (connect, read) timeout in seconds, capped to
+                                the remaining request deadline
+    :param headers:             extra request headers
     """
     headers = {
-        'Authorization': 'Bearer {}'.format(jwt_credentials),
-        'content-type': 'application/json'
+        'content-type': 'application/json',
+        **deadlines.header(),
+        **(headers or {})
     }
-    request = None
-    # Refresh the token
-    jwt_credentials.refresh(request)
+    _authorized_headers(jwt_credentials, 'GET', url, headers)
     # Make authorized request
-    authorized_session = AuthorizedSession(jwt_credentials)
-    authorized_response = authorized_session.get(url)
+    authorized_response = get_session().get(
+        url, headers=headers, timeout=deadlines.timeout(timeout or GATEWAY_TIMEOUT)
+    )
     return authorized_response
   
-def make_authorized_post_request(jwt_credentials, url, data):
+def make_authorized_post_request(jwt_credentials, url, data, timeout=None):
     """
     Makes an authorized POST request to the endpoint
     :param jwt_credentials:     token
     :param url:                 request URL
     :param data:                request data (JSON)
+    :param timeout:             (connect, read) timeout in seconds, capped to
+                                the remaining request deadline
     """
     headers = {
-        'Authorization': 'Bearer {}'.format(jwt_credentials),
-        'content-type': 'application/json'
+        'content-type': 'application/json',
+        **deadlines.header()
     }
-    request = None
-    # Refresh the token
-    jwt_credentials.refresh(request)
+    _authorized_headers(jwt_credentials, 'POST', url, headers)
     # Make authorized request
-    authorized_session = AuthorizedSession(jwt_credentials)
-    authorized_response = authorized_session.post(url, headers=headers, json=data)
+    authorized_response = get_session().post(
+        url, headers=headers, json=data, timeout=deadlines.timeout(timeout or GATEWAY_TIMEOUT)
+    )
     return authorized_response
 
-def make_authorized_post_files_request(jwt_credentials, url, files):
+def make_authorized_post_files_request(jwt_credentials, url, files, timeout=None):
     """
     Makes an authorized POST request to the endpoint
     :param jwt_credentials:     token
     :param url:                 request URL
-    :param data:                request data (JSON)
+    :param files:               files to upload (multipart)
+    :param timeout:             (connect, read) timeout in seconds, capped to
+                                the remaining request deadline
     """
     headers = {
-        'Authorization': 'Bearer {}'.format(jwt_credentials),
-        'Access-Control-Allow-Origin': '*'
+        'Access-Control-Allow-Origin': '*',
+        **deadlines.header()
     }
-    request = None
-    # Refresh the token
-    jwt_credentials.refresh(request)
+    _authorized_headers(jwt_credentials, 'POST', url, headers)
     # Make authorized request
-    authorized_session = AuthorizedSession(jwt_credentials)
-    authorized_response = authorized_session.post(url, headers=headers, files=files)
+    authorized_response = get_session().post(
+        url, headers=headers, files=files, timeout=deadlines.timeout(timeout or GATEWAY_TIMEOUT)
+    )
     return authorized_response
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=FAN_OUT_WORKERS, thread_name_prefix='fan-out'
+                )
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def fan_out(*calls, timeout=None):
+    """
+    Runs independent calls concurrently and returns their results in order.
+    Raises concurrent.futures.TimeoutError (or DeadlineExceeded without an
+    explicit timeout) if they have not all completed within the deadline;
+    calls that have not started yet are cancelled.
+    The calls run under the caller's request deadline.
+    :param calls:               zero-argument callables
+    :param timeout:             deadline in seconds for all of the calls,
+                                by default the remaining request deadline
+    """
+    on_deadline = timeout is None
+    if on_deadline:
+        timeout = deadlines.remaining()
+    futures = [_get_executor().submit(deadlines.bind(call)) for call in calls]
+    _, not_done = concurrent.futures.wait(futures, timeout=timeout)
+    if not_done:
+        for future in not_done:
+            future.cancel()
+        if on_deadline:
+            raise deadlines.DeadlineExceeded(
+                f"{len(not_done)} of {len(futures)} calls did not complete before the request deadline"
+            )
+        raise concurrent.futures.TimeoutError(
+            f"{len(not_done)} of {len(futures)} calls did not complete in {timeout}s"
+        )
+    return [future.result() for future in futures]
@@ -23,6 +23,7 @@ import time
 
 from google.cloud import firestore
 
+from helpers import deadlines
 from .data_classes import CartItem
 
 firestore_client = firestore.Client()
@@ -40,7 +41,7 @@ def get_cart(uid):
     """
 
     cart = []
-    query_results = firestore_client.collection('carts').where('uid', '==', uid).order_by('modify_time', direction=firestore.Query.DESCENDING).get()
+    query_results = firestore_client.collection('carts').where('uid', '==', uid).order_by('modify_time', direction=firestore.Query.DESCENDING).get(timeout=deadlines.timeout())
     for result in query_results:
         item = CartItem.deserialize(result)
         cart.append(item)
@@ -64,7 +65,7 @@ def add_to_cart(uid, item_id):
         item_id=item_id,
         modify_time=int(time.time()))
 
-    firestore_client.collection('carts').document().set(asdict(item))
+    firestore_client.collection('carts').document().set(asdict(item), timeout=deadlines.timeout())
 
 
 def remove_from_cart(uid, item_id):
@@ -83,7 +84,7 @@ def remove_from_cart(uid, item_id):
 
     @firestore.transactional
     def transactional_remove_from_cart(transaction, uid, item_id):
-        query_results = firestore_client.collection('carts').where('uid', '==', uid).where('item_id', '==', item_id).get()
+        query_results = firestore_client.collection('carts').where('uid', '==', uid).where('item_id', '==', item_id).get(timeout=deadlines.timeout())
         for result in query_results:
             reference = firestore_client.collection('carts').document(result.id)
             transaction.delete(reference)
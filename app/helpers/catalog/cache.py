@@ -0,0 +1,252 @@
+# Copyright 2018 Google LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+A per-worker cache with stale-while-revalidate and refresh-ahead.
+"""
+
+
+from collections import OrderedDict, namedtuple
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from helpers.gateway import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+# A cached value together with a fingerprint of its contents. Equal
+# contents have equal versions on every replica, so the version can key
+# derived data (rendered fragments, ETags) across refreshes.
+Snapshot = namedtuple('Snapshot', ['items', 'version'])
+
+# A loader result that was already age seconds old when loaded, e.g. one
+# read from the shared tier. Its entry expires that much sooner, so that
+# the tiers' TTLs do not add up.
+Aged = namedtuple('Aged', ['value', 'age'])
+
+
+def fingerprint(value):
+    """
+    Returns a short hash of a JSON-compatible value.
+    """
+    encoded = json.dumps(value, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.blake2b(encoded.encode(), digest_size=8).hexdigest()
+
+
+class _Entry:
+    def __init__(self, value, loader, age=0):
+        self.value = value
+        self.version = fingerprint(value)
+        self.loader = loader
+        self.fetched_at = time.monotonic() - age
+        self.last_access = self.fetched_at
+        self.hits = 0
+
+
+class TTLCache:
+    """
+    A size-bounded cache of loader results.
+
+    An entry is fresh for ttl seconds. For another stale_ttl seconds it is
+    still served, while a background refresh fetches a new value; after that
+    it is reloaded in the request. Entries that have been read within the
+    last ttl seconds count as hot and are refreshed ahead of expiry (at
+    refresh_ahead of their ttl), so that requests normally only see fresh
+    entries. Concurrent misses of a key share one load. Values are shared
+    between callers, who must treat them as read-only. A loader may return
+    an Aged value, whose age counts towards the entry's ttl.
+
+    Parameters:
+       ttl (float): Seconds an entry is fresh.
+       stale_ttl (float): Seconds a stale entry may still be served.
+       max_entries (int): Size bound; least recently used entries go first.
+       refresh_ahead (float): Fraction of ttl after which hot entries are
+                              refreshed in the background.
+       refresh_interval (float): Seconds between refresher passes.
+    """
+
+    def __init__(self, ttl=60, stale_ttl=300, max_entries=128, refresh_ahead=0.8,
+                 refresh_interval=1.0):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.refresh_ahead = refresh_ahead
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._pending = set()
+        self._single_flight = SingleFlight()
+        self._wakeup = threading.Event()
+        self._refresher = None
+        # Bumped by invalidate(), so that loads started before a write
+        # neither store nor share their (possibly outdated) result.
+        self._generation = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    def get(self, key, loader):
+        """
+        Returns the cached value of a key, loading it on a miss.
+
+        Parameters:
+           key (hashable): The cache key.
+           loader (func): A zero-argument callable returning the value.
+
+        Output:
+           The cached or freshly loaded value.
+        """
+        return self.lookup(key, loader).items
+
+    def lookup(self, key, loader):
+        """
+        Like get(), but also returns the version of the value.
+
+        Output:
+           A Snapshot of the value and its version.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                age = now - entry.fetched_at
+                if age < self.ttl + self.stale_ttl:
+                    self._entries.move_to_end(key)
+                    entry.last_access = now
+                    entry.hits += 1
+                    if age < self.ttl:
+                        self.hits += 1
+                    else:
+                        self.stale_hits += 1
+                        self._pending.add(key)
+                        self._wakeup.set()
+                    self._ensure_refresher()
+                    return Snapshot(entry.value, entry.version)
+            self.misses += 1
+            generation = self._generation
+        entry = self._single_flight.do((key, generation),
+                                       lambda: self._load(key, loader, generation))
+        return Snapshot(entry.value, entry.version)
+
+    def peek(self, key, fresh=False):
+        """
+        Returns the Snapshot of a servable entry (with fresh, of an entry
+        younger than ttl) without loading, refreshing or counting it, or None.
+        """
+        max_age = self.ttl if fresh else self.ttl + self.stale_ttl
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry.fetched_at >= max_age:
+                return None
+            return Snapshot(entry.value, entry.version)
+
+    def invalidate(self, key=None):
+        """
+        Drops one entry, or all entries without a key.
+        """
+        with self._lock:
+            self._generation += 1
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self):
+        """
+        Returns hit, stale hit and miss counts, the hit ratio, refresh
+        counts and the age and hits of every entry.
+        """
+        now = time.monotonic()
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'hit_ratio': (self.hits + self.stale_hits) / lookups if lookups else None,
+                'refreshes': self.refreshes,
+                'refresh_errors': self.refresh_errors,
+                'entries': {
+                    str(key): {
+                        'age': round(now - entry.fetched_at, 3),
+                        'hits': entry.hits,
+                        'version': entry.version,
+                    }
+                    for key, entry in self._entries.items()
+                },
+            }
+
+    def _load(self, key, loader, generation):
+        result = loader()
+        if isinstance(result, Aged):
+            entry = _Entry(result.value, loader, max(result.age, 0))
+        else:
+            entry = _Entry(result, loader)
+        with self._lock:
+            if generation == self._generation:
+                self._store(key, entry)
+        return entry
+
+    def _store(self, key, entry):
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            entry.last_access = previous.last_access
+            entry.hits = previous.hits
+        self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _ensure_refresher(self):
+        # Started lazily, so that each forked worker runs its own.
+        if self._refresher is None or not self._refresher.is_alive():
+            self._refresher = threading.Thread(
+                target=self._refresh_loop, name='catalog-refresher', daemon=True
+            )
+            self._refresher.start()
+
+    def _due_for_refresh(self, now):
+        due = []
+        with self._lock:
+            generation = self._generation
+            for key, entry in self._entries.items():
+                age = now - entry.fetched_at
+                hot = now - entry.last_access < self.ttl
+                if key in self._pending or (hot and age >= self.ttl * self.refresh_ahead):
+                    due.append((key, entry.loader))
+            self._pending.clear()
+        return due, generation
+
+    def _refresh_loop(self):
+        while True:
+            self._wakeup.wait(self.refresh_interval)
+            self._wakeup.clear()
+            due, generation = self._due_for_refresh(time.monotonic())
+            for key, loader in due:
+                try:
+                    self._single_flight.do((key, generation),
+                                           lambda: self._load(key, loader, generation))
+                    with self._lock:
+                        self.refreshes += 1
+                except Exception:
+                    # Keep serving the stale value; the next pass retries.
+                    with self._lock:
+                        self.refresh_errors += 1
+                    logger.exception("Error refreshing catalog cache entry %s", key)
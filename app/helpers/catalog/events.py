@@ -0,0 +1,101 @@
+# Copyright 2018 Google LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Catalog cache invalidation from the new-product events on Cloud Pub/Sub.
+"""
+
+
+import json
+import logging
+import os
+import socket
+
+from google.api_core.exceptions import AlreadyExists
+from google.cloud import pubsub_v1
+
+GCP_PROJECT_ID = os.environ.get('GCP_PROJECT_ID')
+PUBSUB_TOPIC_NEW_PRODUCT = os.environ.get('PUBSUB_TOPIC_NEW_PRODUCT')
+
+# Every replica needs its own subscription to see every event; its name is
+# this prefix plus the host (pod) name. Unused subscriptions of replicas
+# that are gone expire after CATALOG_EVENTS_EXPIRATION seconds.
+CATALOG_EVENTS_SUBSCRIPTION_PREFIX = os.environ.get('CATALOG_EVENTS_SUBSCRIPTION_PREFIX')
+CATALOG_EVENTS_EXPIRATION = int(os.environ.get('CATALOG_EVENTS_EXPIRATION', '86400'))
+
+NEW_PRODUCT_EVENT = 'new-product-sub'
+
+logger = logging.getLogger(__name__)
+
+
+def parse_event(data):
+    """
+    Helper function for reading a new-product event.
+
+    Parameters:
+       data (bytes): The message data, as published by eventing.stream_event.
+
+    Output:
+       The event context dict, or None for other or malformed messages.
+    """
+    try:
+        event = json.loads(data)
+    except ValueError:
+        return None
+    if not isinstance(event, dict) or event.get('event_type') != NEW_PRODUCT_EVENT:
+        return None
+    return event.get('event_context') or {}
+
+
+def subscribe(on_event):
+    """
+    Helper function for calling on_event(event_context) for every
+    new-product event, through a subscription of this replica's own.
+
+    Parameters:
+       on_event (func): Called with the context of each event.
+
+    Output:
+       The streaming pull future of the subscription.
+    """
+    subscriber = pubsub_v1.SubscriberClient()
+    topic_path = subscriber.topic_path(GCP_PROJECT_ID, PUBSUB_TOPIC_NEW_PRODUCT)
+    subscription_path = subscriber.subscription_path(
+        GCP_PROJECT_ID, f'{CATALOG_EVENTS_SUBSCRIPTION_PREFIX}-{socket.gethostname()}'
+    )
+    try:
+        subscriber.create_subscription(request={
+            'name': subscription_path,
+            'topic': topic_path,
+            'ack_deadline_seconds': 10,
+            'expiration_policy': {'ttl': {'seconds': CATALOG_EVENTS_EXPIRATION}},
+        })
+    except AlreadyExists:
+        pass
+
+    def callback(message):
+        context = parse_event(message.data)
+        if context is not None:
+            try:
+                on_event(context)
+            except Exception:
+                logger.exception("Error applying catalog event")
+        message.ack()
+
+    logger.info("Listening for catalog events on %s", subscription_path)
+    return subscriber.subscribe(
+        subscription_path, callback,
+        flow_control=pubsub_v1.types.FlowControl(max_messages=10),
+    )
@@ -0,0 +1,83 @@
+# Copyright 2018 Google LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+A cache of rendered catalog partials.
+"""
+
+
+from collections import OrderedDict
+import threading
+
+from flask import render_template
+from markupsafe import Markup
+
+
+class FragmentCache:
+    """
+    Keeps the rendered HTML of template partials whose output depends only
+    on the catalog version, the bucket and whether a user is signed in, so
+    that a page only renders its per-request parts.
+
+    Parameters:
+       max_entries (int): Size bound; least recently used fragments go first.
+    """
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._fragments = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, template_name, snapshot, bucket, signed_in, items_name):
+        """
+        Returns the rendered partial, rendering it only for a new key.
+
+        Parameters:
+           template_name (str): The partial, e.g. "parts/course_catalog.html".
+           snapshot (Snapshot): The catalog list and its version.
+           bucket (str): The Cloud Storage bucket of the images.
+           signed_in (bool): Whether the partial shows signed-in controls.
+           items_name (str): The template variable of the list.
+
+        Output:
+           The HTML as Markup.
+        """
+        key = (template_name, snapshot.version, bucket, signed_in)
+        with self._lock:
+            html = self._fragments.get(key)
+            if html is not None:
+                self._fragments.move_to_end(key)
+                self.hits += 1
+                return html
+            self.misses += 1
+        # The partials only test auth_context for truthiness.
+        html = Markup(render_template(
+            template_name, bucket=bucket, auth_context=signed_in,
+            **{items_name: snapshot.items}
+        ))
+        with self._lock:
+            self._fragments[key] = html
+            while len(self._fragments) > self.max_entries:
+                self._fragments.popitem(last=False)
+        return html
+
+    def stats(self):
+        """
+        Returns hit and miss counts and the number of fragments.
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._fragments)}
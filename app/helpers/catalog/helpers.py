@@ -0,0 +1,469 @@
+# Copyright 2018 Google LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+A collection of helper functions for reading the course and resource
+catalog through a per-worker cache, optionally backed by a cache shared
+with the other replicas (CATALOG_REDIS_URL).
+"""
+
+
+import logging
+import os
+import threading
+
+from helpers import gateway
+from . import events
+from .cache import TTLCache
+from .fragments import FragmentCache
+from .index import CatalogIndex
+from .membership import BloomFilter, NegativeCache
+from .shared import SharedTier, connect
+
+logger = logging.getLogger(__name__)
+
+CATALOG_CACHE_TTL = float(os.environ.get('CATALOG_CACHE_TTL', '60'))
+CATALOG_CACHE_STALE_TTL = float(os.environ.get('CATALOG_CACHE_STALE_TTL', '300'))
+CATALOG_CACHE_MAX_ENTRIES = int(os.environ.get('CATALOG_CACHE_MAX_ENTRIES', '128'))
+CATALOG_DETAIL_CACHE_MAX_ENTRIES = int(os.environ.get('CATALOG_DETAIL_CACHE_MAX_ENTRIES', '512'))
+# redis://host:6379/0 for a shared tier, memory:// for an in-process fake.
+CATALOG_REDIS_URL = os.environ.get('CATALOG_REDIS_URL')
+CATALOG_FRAGMENT_CACHE_SIZE = int(os.environ.get('CATALOG_FRAGMENT_CACHE_SIZE', '64'))
+CATALOG_BLOOM_ERROR_RATE = float(os.environ.get('CATALOG_BLOOM_ERROR_RATE', '0.01'))
+CATALOG_NEGATIVE_CACHE_TTL = float(os.environ.get('CATALOG_NEGATIVE_CACHE_TTL', '30'))
+
+# The fields the cached lists are projected to: what parts/course_catalog.html,
+# parts/resource_catalog.html and parts/resource_list.html render, plus the
+# IDs the index, select options and membership checks need. Course details
+# (description, instructor, level) are cached per course instead, projected
+# to what parts/course_description.html renders.
+COURSE_LIST_FIELDS = ('course_id', 'title', 'field', 'ratingsAverage', 'thumbnailUrl')
+COURSE_DETAIL_FIELDS = COURSE_LIST_FIELDS + ('description', 'instructor', 'level')
+RESOURCE_LIST_FIELDS = ('resource_id', 'course_id', 'title', 'type', 'description', 'thumbnail')
+
+cache = TTLCache(
+    ttl=CATALOG_CACHE_TTL,
+    stale_ttl=CATALOG_CACHE_STALE_TTL,
+    max_entries=CATALOG_CACHE_MAX_ENTRIES,
+)
+
+# Course details, one entry per course page viewed. Kept apart from the
+# lists so that a crawl of course pages cannot evict them.
+details = TTLCache(
+    ttl=CATALOG_CACHE_TTL,
+    stale_ttl=CATALOG_CACHE_STALE_TTL,
+    max_entries=CATALOG_DETAIL_CACHE_MAX_ENTRIES,
+)
+
+fragments = FragmentCache(CATALOG_FRAGMENT_CACHE_SIZE)
+
+# Resource IDs known from the cached list: (list version, BloomFilter).
+# Course IDs are checked against the exact set of _course_choices instead.
+_resource_bloom = (None, None)
+negative_cache = NegativeCache(CATALOG_NEGATIVE_CACHE_TTL)
+_membership_lock = threading.Lock()
+_membership_stats = {'list_rejections': 0, 'negative_hits': 0}
+
+# Whether this replica receives new-product events, see start_event_listener.
+_events_subscribed = False
+
+# The CatalogIndex of the cached lists, rebuilt when their versions change.
+_index = None
+
+# Course IDs and select options, derived from the cached course list:
+# (list version, frozenset of IDs, tuple of (course_id, title)).
+_course_choices = (None, frozenset(), ())
+
+shared = (SharedTier(connect(CATALOG_REDIS_URL), ttl=CATALOG_CACHE_TTL)
+          if CATALOG_REDIS_URL else None)
+
+
+def _load(key, loader):
+    # Local misses and refreshes go to the shared tier before the gateway.
+    if shared is None:
+        return loader
+    return lambda: shared.get_or_load(key, loader)
+
+
+def course_snapshot():
+    """
+    Helper function for listing all courses along with the list's version.
+
+    Parameters:
+       None.
+
+    Output:
+       A Snapshot of the list of course dicts and its version.
+    """
+    return cache.lookup('courses', _load(
+        'courses', lambda: gateway.client.list_courses(fields=COURSE_LIST_FIELDS)))
+
+
+def resource_snapshot(course_id=None):
+    """
+    Helper function for listing all resources, or those of one course,
+    along with the list's version.
+
+    Parameters:
+       course_id (str): Optional. The unique ID of a course.
+
+    Output:
+       A Snapshot of the list of resource dicts and its version.
+    """
+    if course_id is None:
+        return cache.lookup('resources', _load(
+            'resources', lambda: gateway.client.list_resources(fields=RESOURCE_LIST_FIELDS)))
+    key = 'resources:' + course_id
+    return cache.lookup(key, _load(key, lambda: gateway.client.list_resources(
+        course_id=course_id, fields=RESOURCE_LIST_FIELDS)))
+
+
+def list_courses():
+    """
+    Helper function for listing all courses.
+
+    Parameters:
+       None.
+
+    Output:
+       A list of course dicts. The list is shared; do not modify it.
+    """
+    return course_snapshot().items
+
+
+def list_resources(course_id=None):
+    """
+    Helper function for listing all resources, or those of one course.
+
+    Parameters:
+       course_id (str): Optional. The unique ID of a course.
+
+    Output:
+       A list of resource dicts. The list is shared; do not modify it.
+    """
+    return resource_snapshot(course_id).items
+
+
+def _course_choices_index(snapshot=None):
+    # The IDs and select options of a course list snapshot, by default the
+    # cached one, derived once per list version.
+    global _course_choices
+    if snapshot is None:
+        snapshot = course_snapshot()
+    version, ids, choices = _course_choices
+    if version != snapshot.version:
+        choices = tuple((course['course_id'], course.get('title')) for course in snapshot.items)
+        ids = frozenset(course_id for course_id, _ in choices)
+        _course_choices = (snapshot.version, ids, choices)
+    return ids, choices
+
+
+def catalog_index():
+    """
+    Helper function for getting the index of the cached catalog.
+
+    Parameters:
+       None.
+
+    Output:
+       A CatalogIndex, or None if the course or resource list is not
+       cached (building it would cost more than the lookups it saves).
+    """
+    global _index
+    courses, resources = cache.peek('courses'), cache.peek('resources')
+    if courses is None or resources is None:
+        return None
+    index = _index
+    if index is None or index.version != (courses.version, resources.version):
+        index = _index = CatalogIndex(courses, resources)
+    return index
+
+
+def _get_course_detail(course_id):
+    course = gateway.client.get_course(course_id)
+    if course is None:
+        return None
+    return {field: course[field] for field in COURSE_DETAIL_FIELDS if field in course}
+
+
+def course_detail(course_id):
+    """
+    Helper function for getting a course and its resources, the former from
+    the detail cache (COURSE_DETAIL_FIELDS only) and the latter from the
+    index.
+
+    Parameters:
+       course_id (str): The unique ID of a course.
+
+    Output:
+       A (course dict or None, list of resource dicts) tuple, or None if the
+       index is unavailable or does not have the course; the caller then
+       asks the gateway for both.
+    """
+    index = catalog_index()
+    if index is None:
+        return None
+    if index.course(course_id) is None:
+        return None
+    key = 'course:' + course_id
+    course = details.get(key, _load(key, lambda: _get_course_detail(course_id)))
+    return course, index.resources_of(course_id)
+
+
+def course_choices():
+    """
+    Helper function for getting the options of a course select field.
+
+    Parameters:
+       None.
+
+    Output:
+       A list of (course_id, title) tuples, in catalog order.
+    """
+    return list(_course_choices_index()[1])
+
+
+def is_course(course_id):
+    """
+    Helper function for checking a course ID in constant time.
+
+    Parameters:
+       course_id (str): The ID to check.
+
+    Output:
+       True if the course exists. Courses missing from the cached catalog
+       are confirmed with the gateway unless may_exist() rules them out,
+       so that a course added on another replica is not rejected.
+    """
+    if course_id in _course_choices_index()[0]:
+        return True
+    if not may_exist('course', course_id):
+        return False
+    if gateway.client.get_course(course_id) is None:
+        record_missing('course', course_id)
+        return False
+    return True
+
+
+def render_course_catalog(snapshot, bucket, signed_in):
+    """
+    Helper function for rendering parts/course_catalog.html from the
+    fragment cache.
+
+    Parameters:
+       snapshot (Snapshot): See course_snapshot().
+       bucket (str): The Cloud Storage bucket of the thumbnails.
+       signed_in (bool): Whether to show the View More buttons.
+
+    Output:
+       The HTML as Markup.
+    """
+    return fragments.render('parts/course_catalog.html', snapshot, bucket, signed_in, 'courses')
+
+
+def render_resource_catalog(snapshot, bucket, signed_in):
+    """
+    Helper function for rendering parts/resource_catalog.html from the
+    fragment cache.
+
+    Parameters:
+       snapshot (Snapshot): See resource_snapshot().
+       bucket (str): The Cloud Storage bucket of the thumbnails.
+       signed_in (bool): Whether to show the View More buttons.
+
+    Output:
+       The HTML as Markup.
+    """
+    return fragments.render('parts/resource_catalog.html', snapshot, bucket, signed_in, 'resources')
+
+
+def may_exist(kind, item_id):
+    """
+    Helper function for rejecting lookups of unknown IDs before they reach
+    the gateway.
+
+    Parameters:
+       kind (str): "course" or "resource".
+       item_id (str): The ID requested.
+
+    Output:
+       False if the ID is certainly unknown: recently reported missing, or
+       not in an authoritative cached list of its kind (see
+       _authoritative_snapshot). True otherwise, including when there is no
+       such list (loading it would cost more than the lookup); the caller
+       then asks the gateway and reports misses with record_missing().
+    """
+    global _resource_bloom
+    if (kind, item_id) in negative_cache:
+        _count_membership('negative_hits')
+        return False
+    snapshot = _authoritative_snapshot('courses' if kind == 'course' else 'resources')
+    if snapshot is None:
+        return True
+    if kind == 'course':
+        # The exact set is built from the course list anyway.
+        known = item_id in _course_choices_index(snapshot)[0]
+    else:
+        version, bloom = _resource_bloom
+        if version != snapshot.version:
+            bloom = BloomFilter.from_items(
+                (item.get('resource_id') or '' for item in snapshot.items),
+                CATALOG_BLOOM_ERROR_RATE,
+            )
+            _resource_bloom = (snapshot.version, bloom)
+        known = item_id in bloom
+    if not known:
+        _count_membership('list_rejections')
+    return known
+
+
+def _count_membership(counter):
+    with _membership_lock:
+        _membership_stats[counter] += 1
+
+
+def _authoritative_snapshot(key):
+    # A cached list only proves an ID absent if it cannot predate the ID:
+    # it must be within its TTL, and writes on other replicas must reach
+    # this cache (shared tier or catalog events). Otherwise a product added
+    # elsewhere would be a hard 404 here until the next refresh.
+    if shared is None and not _events_subscribed:
+        return None
+    return cache.peek(key, fresh=True)
+
+
+def record_missing(kind, item_id):
+    """
+    Helper function for remembering an ID the gateway reported missing, so
+    that it is rejected by may_exist() for CATALOG_NEGATIVE_CACHE_TTL.
+
+    Parameters:
+       kind (str): "course" or "resource".
+       item_id (str): The ID requested.
+
+    Output:
+       None.
+    """
+    negative_cache.add((kind, item_id))
+
+
+def invalidate():
+    """
+    Helper function for dropping the cached catalog after a write, on this
+    and (with a shared tier) every other replica.
+
+    Parameters:
+       None.
+
+    Output:
+       None.
+    """
+    # Shared tier first: a local reload must not pick up the old version.
+    if shared is not None:
+        shared.invalidate()
+    _invalidate_local()
+
+
+def _invalidate_local():
+    cache.invalidate()
+    details.invalidate()
+    negative_cache.clear()
+
+
+def start_invalidation_listener():
+    """
+    Helper function for dropping the local cache whenever another replica
+    invalidates the catalog. Does nothing without a shared tier.
+
+    Parameters:
+       None.
+
+    Output:
+       None.
+    """
+    if shared is not None:
+        shared.listen(_invalidate_local)
+
+
+def apply_event(event_context):
+    """
+    Helper function for dropping the cache entries a new-product event
+    makes outdated. The event only invalidates this replica's entries; the
+    replica that handled the write has already retired the shared ones.
+
+    Parameters:
+       event_context (dict): The context of the event; see
+                             add_course_page.process and
+                             upload_resource_page.process.
+
+    Output:
+       None.
+    """
+    product_type = event_context.get('product_type')
+    if product_type == 'course':
+        cache.invalidate('courses')
+        if event_context.get('product_id'):
+            details.invalidate('course:' + event_context['product_id'])
+    elif product_type == 'resource':
+        cache.invalidate('resources')
+        if event_context.get('course_id'):
+            cache.invalidate('resources:' + event_context['course_id'])
+    else:
+        # Events published before products were identified in them.
+        cache.invalidate()
+        details.invalidate()
+    negative_cache.clear()
+
+
+def start_event_listener():
+    """
+    Helper function for applying new-product events to the cache as they
+    are published, which bounds how late a new product shows up on this
+    replica by the Pub/Sub delivery delay rather than the cache TTL. Does
+    nothing unless CATALOG_EVENTS_SUBSCRIPTION_PREFIX is set.
+
+    Parameters:
+       None.
+
+    Output:
+       None.
+    """
+    global _events_subscribed
+    if not events.CATALOG_EVENTS_SUBSCRIPTION_PREFIX:
+        return
+    try:
+        events.subscribe(apply_event)
+        _events_subscribed = True
+    except Exception:
+        # The cache TTL still bounds staleness without the subscription.
+        logger.exception("Error subscribing to catalog events")
+
+
+def _membership_snapshot():
+    with _membership_lock:
+        return dict(_membership_stats)
+
+
+def stats():
+    """
+    Helper function for getting the counters of the catalog cache.
+    """
+    return {
+        **cache.stats(),
+        'details': {k: v for k, v in details.stats().items() if k != 'entries'},
+        'shared': shared.stats() if shared is not None else None,
+        'fragments': fragments.stats(),
+        'membership': {**_membership_snapshot(), 'negative_entries': len(negative_cache)},
+    }
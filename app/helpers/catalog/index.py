@@ -0,0 +1,52 @@
+# Copyright 2018 Google LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+An in-memory index of the cached catalog lists.
+"""
+
+
+class CatalogIndex:
+    """
+    Courses by course_id and resources grouped by course_id, built from the
+    course and resource lists. The index is immutable; a new one is built
+    whenever either list changes.
+
+    Parameters:
+       courses (Snapshot): The cached course list.
+       resources (Snapshot): The cached resource list.
+    """
+
+    def __init__(self, courses, resources):
+        self.version = (courses.version, resources.version)
+        self._courses = {course.get('course_id'): course for course in courses.items}
+        self._resources_by_course = {}
+        for resource in resources.items:
+            self._resources_by_course.setdefault(resource.get('course_id'), []).append(resource)
+
+    def course(self, course_id):
+        """
+        Returns the course dict of an ID, or None.
+        """
+        return self._courses.get(course_id)
+
+    def resources_of(self, course_id):
+        """
+        Returns the resource dicts of a course, in catalog order.
+        """
+        return self._resources_by_course.get(course_id, [])
+
+    def __len__(self):
+        return len(self._courses)
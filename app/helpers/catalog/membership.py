@@ -0,0 +1,105 @@
+# Copyright 2018 Google LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Membership tests for rejecting lookups of unknown IDs without upstream calls.
+"""
+
+
+from collections import OrderedDict
+import hashlib
+import math
+import threading
+import time
+
+
+class BloomFilter:
+    """
+    A Bloom filter of strings: "not in" is certain, "in" is right except for
+    a false positive rate of about error_rate at the given capacity.
+
+    Parameters:
+       capacity (int): The number of items the filter is sized for.
+       error_rate (float): The false positive rate at capacity.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    @classmethod
+    def from_items(cls, items, error_rate=0.01):
+        items = list(items)
+        bloom = cls(len(items), error_rate)
+        for item in items:
+            bloom.add(item)
+        return bloom
+
+    def _positions(self, item):
+        # Double hashing: k positions from the two halves of one digest.
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(item))
+
+
+class NegativeCache:
+    """
+    Remembers IDs the upstream reported missing, for ttl seconds.
+
+    Parameters:
+       ttl (float): Seconds to remember a missing ID.
+       max_entries (int): Size bound; the oldest IDs go first.
+    """
+
+    def __init__(self, ttl=30, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._expires_at = OrderedDict()
+
+    def add(self, key):
+        with self._lock:
+            self._expires_at.pop(key, None)
+            self._expires_at[key] = time.monotonic() + self.ttl
+            while len(self._expires_at) > self.max_entries:
+                self._expires_at.popitem(last=False)
+
+    def __contains__(self, key):
+        with self._lock:
+            expires_at = self._expires_at.get(key)
+            if expires_at is None:
+                return False
+            if expires_at <= time.monotonic():
+                del self._expires_at[key]
+                return False
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._expires_at.clear()
+
+    def __len__(self):
+        return len(self._expires_at)
@@ -0,0 +1,230 @@
+# Copyright 2018 Google LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+A cache tier shared by the app replicas, with cross-replica invalidation.
+"""
+
+
+import json
+import logging
+import threading
+import time
+
+# The shared tier is optional; without redis-py only the in-process fake
+# (memory://) is available.
+try:
+    import redis
+except ImportError:
+    redis = None
+
+from .cache import Aged
+
+logger = logging.getLogger(__name__)
+
+
+class FakeRedisServer:
+    """
+    In-process stand-in for a Redis server, shared by FakeRedis clients.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.data = {}
+        self.expires_at = {}
+        self.subscribers = {}
+
+
+class FakeRedis:
+    """
+    The subset of the redis-py client used by SharedTier, kept in memory.
+    Clients created with the same server see each other's keys and
+    messages, like replicas connected to one Redis.
+    """
+
+    def __init__(self, server=None):
+        self.server = server or FakeRedisServer()
+
+    def get(self, key):
+        with self.server.lock:
+            expires_at = self.server.expires_at.get(key)
+            if expires_at is not None and expires_at <= time.monotonic():
+                self.server.data.pop(key, None)
+                self.server.expires_at.pop(key, None)
+            return self.server.data.get(key)
+
+    def set(self, key, value, ex=None):
+        if isinstance(value, str):
+            value = value.encode()
+        with self.server.lock:
+            self.server.data[key] = value
+            if ex is None:
+                self.server.expires_at.pop(key, None)
+            else:
+                self.server.expires_at[key] = time.monotonic() + ex
+        return True
+
+    def incr(self, key):
+        with self.server.lock:
+            value = int(self.server.data.get(key, b'0')) + 1
+            self.server.data[key] = str(value).encode()
+            return value
+
+    def publish(self, channel, message):
+        if isinstance(message, str):
+            message = message.encode()
+        with self.server.lock:
+            handlers = list(self.server.subscribers.get(channel, []))
+        for handler in handlers:
+            handler({'type': 'message', 'channel': channel.encode(), 'data': message})
+        return len(handlers)
+
+    def subscribe(self, channel, handler):
+        with self.server.lock:
+            self.server.subscribers.setdefault(channel, []).append(handler)
+
+
+def connect(url):
+    """
+    Returns a client for a shared cache URL: redis://, rediss:// or
+    memory:// (an in-process FakeRedis, for tests and local runs).
+    """
+    if url.startswith('memory://'):
+        return FakeRedis()
+    if redis is None:
+        raise RuntimeError('redis is required for the shared cache tier: pip install redis')
+    return redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+
+
+class SharedTier:
+    """
+    The second level of the catalog cache.
+
+    Values are stored as JSON under a key that includes the catalog version.
+    invalidate() bumps the version, which retires every shared entry at
+    once, and announces it on a channel so that each replica also drops
+    its local entries. A replica that misses the announcement still never
+    reads an outdated shared entry, and its local entries expire with
+    their TTL. Shared entries carry the time they were loaded, so that a
+    local cache counts their age towards its own TTL: a value is served
+    at most ttl + stale_ttl of the local cache after it was loaded. Errors
+    of the shared tier are counted and fall back to the loader; they never
+    fail a request.
+
+    Parameters:
+       client: A redis-py client or FakeRedis.
+       ttl (float): Seconds a shared entry lives.
+       prefix (str): Namespace of the keys and channel.
+    """
+
+    def __init__(self, client, ttl=60, prefix='catalog'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.version_key = prefix + ':version'
+        self.channel = prefix + ':invalidate'
+        self._lock = threading.Lock()
+        self._listener = None
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.invalidations_received = 0
+
+    def get_or_load(self, key, loader):
+        """
+        Returns the shared value of a key, loading and sharing it on a miss.
+
+        Parameters:
+           key (str): The cache key.
+           loader (func): A zero-argument callable returning the value.
+
+        Output:
+           An Aged value: the value and the seconds since it was loaded.
+        """
+        try:
+            version = int(self.client.get(self.version_key) or 0)
+            shared_key = f'{self.prefix}:{version}:{key}'
+            raw = self.client.get(shared_key)
+        except Exception:
+            self._count('errors')
+            logger.exception("Error reading shared catalog cache")
+            return loader()
+        if raw is not None:
+            self._count('hits')
+            stored = json.loads(raw)
+            return Aged(stored['value'], time.time() - stored['loaded_at'])
+
+        self._count('misses')
+        value = loader()
+        stored = {'value': value, 'loaded_at': time.time()}
+        try:
+            self.client.set(shared_key, json.dumps(stored), ex=max(int(self.ttl), 1))
+        except Exception:
+            self._count('errors')
+            logger.exception("Error writing shared catalog cache")
+        return Aged(value, 0)
+
+    def invalidate(self):
+        """
+        Retires all shared entries and tells every replica to drop its own.
+        """
+        try:
+            version = self.client.incr(self.version_key)
+            self.client.publish(self.channel, str(version))
+        except Exception:
+            self._count('errors')
+            logger.exception("Error invalidating shared catalog cache")
+
+    def listen(self, on_invalidate):
+        """
+        Calls on_invalidate() whenever any replica invalidates the catalog.
+        """
+        if self._listener is not None:
+            return
+
+        def handler(message):
+            self._count('invalidations_received')
+            on_invalidate()
+
+        if isinstance(self.client, FakeRedis):
+            self.client.subscribe(self.channel, handler)
+            self._listener = True
+        else:
+            def on_error(error, pubsub, thread):
+                # Keep listening; redis-py reconnects on the next read.
+                self._count('errors')
+                logger.error("Error listening for catalog invalidations", exc_info=error)
+                time.sleep(1)
+
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{self.channel: handler})
+            self._listener = pubsub.run_in_thread(sleep_time=1, daemon=True,
+                                                  exception_handler=on_error)
+
+    def stats(self):
+        """
+        Returns hit, miss, error and received invalidation counts.
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'errors': self.errors,
+                'invalidations_received': self.invalidations_received,
+            }
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
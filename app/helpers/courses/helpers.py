@@ -87,29 +87,28 @@ def list_course():
     url = f"{CLOUD_FUNCTION_BASE_URL}/courses"
     response = requests.get(url)
     if response.ok:
-        courses_data = response.json()
-        courses = []
-        for res in courses_data:
-            course = Course(
-                course_id=res.get("course_id"),
-                title=res.get("title"),
-                instructor=res.get("instructor"),
-                field=res.get("field"),
-                level=res.get("level"),
-                language=res.get("language"),
-                thumbnailUrl=res.get("thumbnailUrl"),
-                description=res.get("description"),
-                uid=res.get("uid"),
-                ratingsAverage=res.get("ratingsAverage"),
-                ratingsCount=res.get("ratingsCount"),
-                document_id=res.get("document_id"),
-            )
-            courses.append(course)
-        return courses
+        return [_course_from_dict(res) for res in response.json()]
     else:
         response.raise_for_status()
 
 
+def _course_from_dict(res):
+    return Course(
+        course_id=res.get("course_id"),
+        title=res.get("title"),
+        instructor=res.get("instructor"),
+        field=res.get("field"),
+        level=res.get("level"),
+        language=res.get("language"),
+        thumbnailUrl=res.get("thumbnailUrl"),
+        description=res.get("description"),
+        uid=res.get("uid"),
+        ratingsAverage=res.get("ratingsAverage"),
+        ratingsCount=res.get("ratingsCount"),
+        document_id=res.get("document_id"),
+    )
+
+
 
 def remove_course(uid, course_id):
     """
@@ -0,0 +1,132 @@
+# Copyright 2018 Google LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+"""
+A collection of helper functions for per-request deadlines.
+
+A deadline is started when a request comes in and every upstream call made
+on its behalf (API Gateway, Firestore, Pub/Sub) uses the remaining budget
+as its timeout. The budget is forwarded to the helper functions in the
+X-Request-Deadline-Ms header so that they can give up on work nobody will
+wait for.
+"""
+
+
+import contextvars
+import os
+import time
+
+REQUEST_DEADLINE_SECONDS = float(os.environ.get('REQUEST_DEADLINE_SECONDS', '15'))
+DEADLINE_HEADER = 'X-Request-Deadline-Ms'
+
+_deadline = contextvars.ContextVar('deadline', default=None)
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised when the request's deadline has passed before an upstream call.
+    """
+
+
+def start(budget=REQUEST_DEADLINE_SECONDS):
+    """
+    Helper function for starting the deadline of the current request.
+
+    Parameters:
+       budget (float): The time budget of the request in seconds.
+
+    Output:
+       A token for reset().
+    """
+    return _deadline.set(time.monotonic() + budget)
+
+
+def reset(token):
+    """
+    Helper function for clearing a deadline set by start().
+    """
+    _deadline.reset(token)
+
+
+def remaining():
+    """
+    Helper function for getting the remaining budget of the current request.
+
+    Output:
+       The remaining seconds (never negative), or None without a deadline.
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return max(deadline - time.monotonic(), 0.0)
+
+
+def timeout(default=None):
+    """
+    Helper function for getting the timeout of an upstream call.
+
+    Parameters:
+       default (float or tuple): The call's own timeout, either in seconds or
+                                 as a requests-style (connect, read) tuple.
+
+    Output:
+       The default capped to the remaining budget.
+    """
+    budget = remaining()
+    if budget is None:
+        return default
+    if budget <= 0:
+        raise DeadlineExceeded('Request deadline exceeded')
+    if default is None:
+        return budget
+    if isinstance(default, tuple):
+        return tuple(min(part, budget) for part in default)
+    return min(default, budget)
+
+
+def header():
+    """
+    Helper function for getting the header that forwards the budget.
+
+    Output:
+       A dict with the remaining budget in milliseconds, or an empty dict.
+    """
+    budget = remaining()
+    if budget is None:
+        return {}
+    return {DEADLINE_HEADER: str(int(budget * 1000))}
+
+
+def bind(fn):
+    """
+    Helper function for carrying the current deadline into another thread.
+
+    Parameters:
+       fn (func): A callable that will run on a worker thread.
+
+    Output:
+       A callable that runs fn under the caller's deadline. It may be called
+       concurrently, e.g. by a hedged request.
+    """
+    deadline = _deadline.get()
+
+    def bound(*args, **kwargs):
+        token = _deadline.set(deadline)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _deadline.reset(token)
+    return bound
@@ -24,9 +24,12 @@ import time
 
 from google.cloud import pubsub_v1
 
+from helpers import deadlines
+
 publisher = pubsub_v1.PublisherClient()
 
 GCP_PROJECT_ID = os.environ.get('GCP_PROJECT_ID')
+PUBSUB_PUBLISH_TIMEOUT = float(os.environ.get('PUBSUB_PUBLISH_TIMEOUT', '10'))
 
 def stream_event(topic_name, event_type, event_context):
     """
@@ -49,7 +52,9 @@ def stream_event(topic_name, event_type, event_context):
     data = json.dumps(request).encode("utf-8")
     try:
         future = publisher.publish(topic_path, data)
-        message_id = future.result()
+        # Only the wait is bounded by the request's deadline; the publisher
+        # keeps the message queued and still delivers it after a timeout.
+        message_id = future.result(timeout=deadlines.timeout(PUBSUB_PUBLISH_TIMEOUT))
         print(f"Published message {message_id} to {topic_path}")
     except Exception as e:
         print(f"Error publishing message: {e}")
@@ -0,0 +1,135 @@
+# Copyright 2018 Google LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+
+"""
+Dataloader-style batching of lookups by ID.
+"""
+
+
+import concurrent.futures
+import threading
+import time
+
+
+class _LoaderFuture(concurrent.futures.Future):
+    def __init__(self, loader):
+        super().__init__()
+        self._loader = loader
+
+    def result(self, timeout=None):
+        # The first caller to need a value sends everything queued so far.
+        if not self.done():
+            self._loader.dispatch()
+        return super().result(timeout)
+
+
+class BatchLoader:
+    """
+    Collects the keys requested within a short window and fetches them with
+    one batch call instead of one call per key.
+
+    load() only queues a key and returns a future; the batch is sent when
+    the first of the futures is resolved, after waiting for the rest of the
+    window so that other threads of the same request can add their keys.
+    Values are remembered, so a key is fetched at most once per loader;
+    use one loader per request.
+
+    Parameters:
+       batch_fn (func): Takes a list of keys and returns a dict of the
+                        values found; missing keys load as None.
+       window (float): Seconds to collect keys for after the first one.
+       max_batch_size (int): Maximum number of keys per batch call.
+    """
+
+    def __init__(self, batch_fn, window=0.002, max_batch_size=100):
+        self.batch_fn = batch_fn
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._lock = threading.Lock()
+        self._futures = {}
+        self._queue = []
+        self._first_queued_at = None
+        self.batches = 0
+        self.keys_loaded = 0
+
+    def load(self, key):
+        """
+        Queues a key for the next batch.
+
+        Parameters:
+           key (hashable): The key to load, e.g. a course ID.
+
+        Output:
+           A future whose result() is the value, or None if it was not found.
+        """
+        with self._lock:
+            future = self._futures.get(key)
+            if future is None:
+                future = self._futures[key] = _LoaderFuture(self)
+                self._queue.append(key)
+                if self._first_queued_at is None:
+                    self._first_queued_at = time.monotonic()
+            return future
+
+    def load_many(self, keys):
+        """
+        Loads several keys in as few batch calls as possible.
+
+        Output:
+           A list of values (None for missing keys) in the order of keys.
+        """
+        futures = [self.load(key) for key in keys]
+        return [future.result() for future in futures]
+
+    def dispatch(self):
+        """
+        Sends the queued keys, once the collection window has passed.
+        """
+        with self._lock:
+            first_queued_at = self._first_queued_at
+        if first_queued_at is None:
+            return
+        wait = first_queued_at + self.window - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        with self._lock:
+            keys, self._queue = self._queue, []
+            self._first_queued_at = None
+
+        for start in range(0, len(keys), self.max_batch_size):
+            batch = keys[start:start + self.max_batch_size]
+            with self._lock:
+                self.batches += 1
+                self.keys_loaded += len(batch)
+            try:
+                values = self.batch_fn(batch)
+            except Exception as e:
+                with self._lock:
+                    # Forget failed keys so that a later load() retries them.
+                    futures = [self._futures.pop(key) for key in batch]
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            for key in batch:
+                self._futures[key].set_result(values.get(key))
+
+    def stats(self):
+        """
+        Returns the number of batch calls and of keys they loaded.
+        """
+        with self._lock:
+            return {'batches': self.batches, 'keys_loaded': self.keys_loaded}
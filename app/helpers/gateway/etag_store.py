@@ -0,0 +1,74 @@
+# Copyright 2018 Google LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+
+"""
+Storage of validators for conditional gateway GETs.
+"""
+
+
+from collections import OrderedDict
+import threading
+
+
+class ETagStore:
+    """
+    A bounded LRU map of URL to the ETag and decoded response last received.
+
+    The client sends the stored ETag as If-None-Match and reuses the stored
+    response when the helper answers 304 Not Modified.
+    """
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.revalidated = 0
+
+    def get(self, url):
+        """
+        Returns the (etag, response) pair stored for the URL, or None.
+        """
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+            return entry
+
+    def put(self, url, etag, response):
+        """
+        Stores the ETag and decoded response (for the client, the body and
+        next page token) of a 200 response.
+        """
+        with self._lock:
+            self._entries[url] = (etag, response)
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def hit(self):
+        """
+        Counts a 304 answered from the store.
+        """
+        with self._lock:
+            self.revalidated += 1
+
+    def stats(self):
+        """
+        Returns the number of stored entries and 304 revalidations.
+        """
+        with self._lock:
+            return {'entries': len(self._entries), 'revalidated': self.revalidated}
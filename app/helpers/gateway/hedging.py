@@ -0,0 +1,185 @@
+# Copyright 2018 Google LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+
+"""
+Hedged requests for idempotent gateway reads.
+"""
+
+
+from collections import deque
+import concurrent.futures
+import threading
+import time
+
+from helpers import deadlines
+
+
+def _close_result(future):
+    """
+    Closes the result of a losing attempt, e.g. a requests.Response, so its
+    pooled connection is released rather than held until collected.
+    """
+    if future.cancelled() or future.exception() is not None:
+        return
+    close = getattr(future.result(), 'close', None)
+    if close is not None:
+        close()
+
+
+class HedgePolicy:
+    """
+    Decides when to send a second copy of a slow idempotent request.
+
+    The hedge delay of a route is the given percentile of its recently
+    observed latencies (never less than min_delay). Extra load is capped
+    by a token bucket: every request earns max_ratio tokens and every
+    hedge spends one, so at most max_ratio of requests are hedged.
+
+    Parameters:
+       routes (iterable): Routes eligible for hedging, e.g. "GET /courses".
+       percentile (float): Latency percentile (0-100) used as hedge delay.
+       min_delay (float): Lower bound of the hedge delay in seconds.
+       initial_delay (float): Hedge delay until min_samples are observed.
+       max_ratio (float): Maximum fraction of requests that may be hedged.
+       max_workers (int): Threads available for in-flight attempts.
+       is_retryable (func): Optional. Whether a result is a failure worth
+                            waiting past (e.g. a 503) for the other attempt.
+    """
+
+    def __init__(self, routes, percentile=95, min_delay=0.05, initial_delay=0.5,
+                 max_ratio=0.05, burst=10, min_samples=20, window=256,
+                 max_workers=32, is_retryable=None):
+        self.routes = frozenset(routes)
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.initial_delay = initial_delay
+        self.max_ratio = max_ratio
+        self.burst = burst
+        self.min_samples = min_samples
+        self.window = window
+        self.is_retryable = is_retryable or (lambda result: False)
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='hedge'
+        )
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self._tokens = burst
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.budget_exhausted = 0
+
+    def applies(self, route):
+        return route in self.routes
+
+    def delay(self, route):
+        """
+        Returns how long to wait for the first attempt before hedging.
+        """
+        with self._lock:
+            samples = self._latencies.get(route)
+            if not samples or len(samples) < self.min_samples:
+                return self.initial_delay
+            ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return max(self.min_delay, ordered[index])
+
+    def record_latency(self, route, seconds):
+        with self._lock:
+            samples = self._latencies.get(route)
+            if samples is None:
+                samples = self._latencies[route] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def _start_request(self):
+        with self._lock:
+            self.requests += 1
+            self._tokens = min(self.burst, self._tokens + self.max_ratio)
+
+    def _acquire_hedge(self):
+        with self._lock:
+            if self._tokens < 1:
+                self.budget_exhausted += 1
+                return False
+            self._tokens -= 1
+            self.hedged += 1
+            return True
+
+    def call(self, route, fn):
+        """
+        Runs fn, sending a second fn concurrently if the first has not
+        returned within the route's hedge delay, and returns the first
+        successful result. An exception or retryable result only wins if
+        the other attempt fails too, so a hedge never turns a success into
+        an error. The losing attempt is left to finish on its own and its
+        result is closed once it does. Both attempts run under the caller's
+        request deadline.
+
+        Parameters:
+           route (str): The route of the request, for latency tracking.
+           fn (func): A zero-argument callable performing the request.
+
+        Output:
+           The return value of the first fn to succeed.
+        """
+        self._start_request()
+        fn = deadlines.bind(fn)
+        start = time.monotonic()
+        primary = self.executor.submit(fn)
+        primary.add_done_callback(
+            lambda _: self.record_latency(route, time.monotonic() - start)
+        )
+        done, _ = concurrent.futures.wait([primary], timeout=self.delay(route))
+        if done or not self._acquire_hedge():
+            return primary.result()
+
+        hedge = self.executor.submit(fn)
+        error = None
+        fallback = None
+        for future in concurrent.futures.as_completed([primary, hedge]):
+            try:
+                result = future.result()
+            except Exception as e:
+                error = e
+                continue
+            if self.is_retryable(result):
+                fallback = fallback or future
+                continue
+            if future is hedge:
+                with self._lock:
+                    self.hedge_wins += 1
+            loser = primary if future is hedge else hedge
+            loser.add_done_callback(_close_result)
+            return result
+        if fallback is not None:
+            loser = primary if fallback is hedge else hedge
+            loser.add_done_callback(_close_result)
+            return fallback.result()
+        raise error
+
+    def stats(self):
+        """
+        Returns request, hedge and win counters and the hedge rate.
+        """
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'hedged': self.hedged,
+                'hedge_rate': self.hedged / self.requests if self.requests else None,
+                'hedge_wins': self.hedge_wins,
+                'budget_exhausted': self.budget_exhausted,
+            }
@@ -0,0 +1,443 @@
+# Copyright 2018 Google LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+
+"""
+A client for the API Gateway in front of the course and resource helpers.
+"""
+
+
+import os
+import random
+import threading
+import time
+from urllib.parse import quote
+
+import requests
+from flask import g
+
+# MessagePack is a more compact wire format than JSON for the catalog lists;
+# it is only advertised to the helpers when installed. Brotli, if installed,
+# is picked up by urllib3 for Accept-Encoding and decoded transparently.
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from helpers import auth
+from helpers import deadlines
+from .batch_loader import BatchLoader
+from .circuit_breaker import CircuitBreaker
+from .errors import CircuitOpenError, GatewayError
+from .etag_store import ETagStore
+from .hedging import HedgePolicy
+from .single_flight import SingleFlight
+
+API_GATEWAY = os.environ.get('API_GATEWAY_URL')
+
+GATEWAY_MAX_RETRIES = int(os.environ.get('GATEWAY_MAX_RETRIES', '2'))
+GATEWAY_BACKOFF_BASE = float(os.environ.get('GATEWAY_BACKOFF_BASE', '0.1'))
+GATEWAY_BACKOFF_CAP = float(os.environ.get('GATEWAY_BACKOFF_CAP', '1.0'))
+GATEWAY_BREAKER_THRESHOLD = int(os.environ.get('GATEWAY_BREAKER_THRESHOLD', '5'))
+GATEWAY_BREAKER_RESET = float(os.environ.get('GATEWAY_BREAKER_RESET', '30'))
+GATEWAY_ETAG_CACHE_SIZE = int(os.environ.get('GATEWAY_ETAG_CACHE_SIZE', '256'))
+
+# Lists are read page by page (?limit=&page_token=), following the helpers'
+# X-Next-Page-Token header; 0 reads each list in one unpaged GET.
+GATEWAY_PAGE_SIZE = int(os.environ.get('GATEWAY_PAGE_SIZE', '500'))
+NEXT_PAGE_TOKEN_HEADER = 'X-Next-Page-Token'
+
+# Batch gets: IDs per call (the helpers' limit) and how long per-request
+# loaders collect IDs before sending a batch.
+BATCH_GET_MAX_IDS = 100
+GATEWAY_BATCH_WINDOW = float(os.environ.get('GATEWAY_BATCH_WINDOW', '0.002'))
+
+# Opt-in hedging of idempotent reads, see HedgePolicy.
+GATEWAY_HEDGE = os.environ.get('GATEWAY_HEDGE', '').lower() in ('1', 'true', 'yes')
+GATEWAY_HEDGE_ROUTES = os.environ.get(
+    'GATEWAY_HEDGE_ROUTES', 'GET /courses,GET /resources,GET /courses/{course_id}'
+).split(',')
+GATEWAY_HEDGE_PERCENTILE = float(os.environ.get('GATEWAY_HEDGE_PERCENTILE', '95'))
+GATEWAY_HEDGE_MIN_DELAY = float(os.environ.get('GATEWAY_HEDGE_MIN_DELAY', '0.05'))
+GATEWAY_HEDGE_MAX_RATIO = float(os.environ.get('GATEWAY_HEDGE_MAX_RATIO', '0.05'))
+
+# Responses worth retrying (and counting against the circuit breaker):
+# throttling and server-side failures. Other 4xx responses are final.
+RETRYABLE_STATUS_CODES = frozenset([429, 500, 502, 503, 504])
+
+ACCEPT = ('application/msgpack, application/json;q=0.9' if msgpack is not None
+          else 'application/json')
+
+
+class GatewayClient:
+    """
+    Client for the API Gateway.
+
+    GETs are idempotent: concurrent identical GETs share one upstream call,
+    are revalidated with If-None-Match against the last body received for
+    the URL, and are retried with jittered exponential backoff when they
+    fail. POSTs are sent once. Every route has its own circuit breaker so that a
+    dead backend fails fast instead of tying up request threads. Timeouts and
+    retries are bounded by the deadline of the current request, see
+    helpers.deadlines. Lists are read in pages of page_size, each page
+    being such a GET.
+
+    Parameters:
+       base_url (str): The URL of the API Gateway.
+       sa_keyfile (str): The service account key file used to sign JWTs.
+       timeout (tuple): Default (connect, read) timeout in seconds.
+       max_retries (int): Retries after the first attempt of a GET.
+       page_size (int): Items per page of a list; 0 for unpaged lists.
+       hedge_policy (HedgePolicy): Optional. Hedging of slow GET attempts.
+    """
+
+    def __init__(self, base_url=API_GATEWAY, sa_keyfile="keyfile.json",
+                 timeout=None, max_retries=GATEWAY_MAX_RETRIES,
+                 backoff_base=GATEWAY_BACKOFF_BASE,
+                 backoff_cap=GATEWAY_BACKOFF_CAP,
+                 breaker_threshold=GATEWAY_BREAKER_THRESHOLD,
+                 breaker_reset=GATEWAY_BREAKER_RESET,
+                 hedge_policy=None, page_size=GATEWAY_PAGE_SIZE):
+        self.base_url = base_url
+        self.sa_keyfile = sa_keyfile
+        self.timeout = timeout or auth.GATEWAY_TIMEOUT
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self._breakers = {}
+        self._breakers_lock = threading.Lock()
+        self._single_flight = SingleFlight()
+        self._etags = ETagStore(GATEWAY_ETAG_CACHE_SIZE)
+        self.hedge_policy = hedge_policy
+        self.page_size = page_size
+
+    def list_courses(self, fields=None, timeout=None):
+        """
+        Lists all courses, reading page_size courses per GET.
+
+        Parameters:
+           fields (tuple): Optional. The fields to return; see _list_path.
+
+        Output:
+           A list of course dicts.
+        """
+        return self._list('GET /courses', '/courses', fields, timeout)
+
+    def get_course(self, course_id, timeout=None):
+        """
+        Gets a course.
+
+        Parameters:
+           course_id (str): The unique ID of a course.
+
+        Output:
+           A course dict, or None if the course does not exist.
+        """
+        return self._get('GET /courses/{course_id}', '/courses/' + course_id,
+                         timeout=timeout, not_found_ok=True)
+
+    def list_resources(self, course_id=None, fields=None, timeout=None):
+        """
+        Lists all resources, or the resources of one course, reading
+        page_size resources per GET.
+
+        Parameters:
+           course_id (str): Optional. The unique ID of a course.
+           fields (tuple): Optional. The fields to return; see _list_path.
+
+        Output:
+           A list of resource dicts.
+        """
+        if course_id is None:
+            return self._list('GET /resources', '/resources', fields, timeout)
+        return self._list('GET /resources/course/{course_id}',
+                          '/resources/course/' + course_id, fields, timeout)
+
+    def get_resource(self, resource_id, timeout=None):
+        """
+        Gets a resource.
+
+        Parameters:
+           resource_id (str): The unique ID of a resource.
+
+        Output:
+           A resource dict, or None if the resource does not exist.
+        """
+        return self._get('GET /resources/{resource_id}', '/resources/' + resource_id,
+                         timeout=timeout, not_found_ok=True)
+
+    def batch_get_courses(self, course_ids, timeout=None):
+        """
+        Gets several courses with as few calls as possible.
+
+        Parameters:
+           course_ids (list): The unique IDs of the courses.
+
+        Output:
+           A dict of course dicts by course ID; missing courses are left out.
+        """
+        return self._batch_get('POST /courses:batchGet', '/courses:batchGet',
+                               'courses', 'course_id', course_ids, timeout)
+
+    def batch_get_resources(self, resource_ids, timeout=None):
+        """
+        Gets several resources with as few calls as possible.
+
+        Parameters:
+           resource_ids (list): The unique IDs of the resources.
+
+        Output:
+           A dict of resource dicts by resource ID; missing resources are
+           left out.
+        """
+        return self._batch_get('POST /resources:batchGet', '/resources:batchGet',
+                               'resources', 'resource_id', resource_ids, timeout)
+
+    def create_course(self, course, timeout=None):
+        """
+        Creates a course.
+
+        Parameters:
+           course (dict): The course fields.
+
+        Output:
+           The decoded response of the course helper.
+        """
+        return self._post('POST /courses', '/courses', json=course, timeout=timeout)
+
+    def create_resource(self, resource, timeout=None):
+        """
+        Creates a resource.
+
+        Parameters:
+           resource (dict): The resource fields.
+
+        Output:
+           The decoded response of the resource helper.
+        """
+        return self._post('POST /resources', '/resources', json=resource, timeout=timeout)
+
+    def upload_file(self, files, timeout=None):
+        """
+        Uploads a file to Cloud Storage through the upload_image function.
+
+        Parameters:
+           files (dict): requests-style multipart files.
+
+        Output:
+           A dict with the resource_id and public url of the file.
+        """
+        return self._post('POST /upload_image', '/upload_image', files=files, timeout=timeout)
+
+    def breaker(self, route):
+        """
+        Returns the circuit breaker of a route, creating it on first use.
+        """
+        breaker = self._breakers.get(route)
+        if breaker is None:
+            with self._breakers_lock:
+                breaker = self._breakers.setdefault(
+                    route, CircuitBreaker(self.breaker_threshold, self.breaker_reset)
+                )
+        return breaker
+
+    def stats(self):
+        """
+        Returns a dict of observable client state.
+        """
+        return {
+            'breakers': {route: b.state for route, b in list(self._breakers.items())},
+            'single_flight': self._single_flight.stats(),
+            'etag': self._etags.stats(),
+            'hedging': self.hedge_policy.stats() if self.hedge_policy else None,
+        }
+
+    def _creds(self):
+        return auth.get_creds(self.base_url, sa_keyfile=self.sa_keyfile)
+
+    def _backoff(self, attempt):
+        # "Full jitter": spread retries of concurrent callers over the window.
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def _get(self, route, path, timeout=None, not_found_ok=False):
+        return self._get_page(route, path, timeout, not_found_ok)[0]
+
+    def _get_page(self, route, path, timeout=None, not_found_ok=False):
+        # Returns the body and the token of the next page, if any.
+        url = self.base_url + path
+        return self._single_flight.do(
+            url, lambda: self._get_with_retries(route, url, timeout, not_found_ok)
+        )
+
+    def _list(self, route, path, fields, timeout):
+        # Every page is a GET of its own, with its own retries and ETag,
+        # and the deadline of the request bounds them all.
+        items = []
+        page_token = None
+        while True:
+            page, page_token = self._get_page(
+                route, _list_path(path, fields, self.page_size, page_token), timeout
+            )
+            items.extend(page)
+            if not page_token:
+                return items
+
+    def _get_with_retries(self, route, url, timeout, not_found_ok):
+        breaker = self.breaker(route)
+        error = None
+        stored = self._etags.get(url)
+        headers = {'Accept': ACCEPT}
+        if stored:
+            headers['If-None-Match'] = stored[0]
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                backoff = self._backoff(attempt - 1)
+                budget = deadlines.remaining()
+                if budget is not None and budget <= backoff:
+                    # No time left for another attempt; report the last error.
+                    break
+                time.sleep(backoff)
+            if not breaker.allow():
+                raise CircuitOpenError(f"Circuit open for {route}")
+            try:
+                response = self._attempt_get(route, url, timeout, headers)
+            except requests.RequestException as e:
+                breaker.record_failure()
+                if deadlines.remaining() == 0:
+                    raise deadlines.DeadlineExceeded(f"{route} exceeded the request deadline")
+                error = GatewayError(f"{route} failed: {e}")
+                continue
+            if response.status_code in RETRYABLE_STATUS_CODES:
+                breaker.record_failure()
+                error = GatewayError(f"{route} returned {response.status_code}",
+                                     response.status_code)
+                continue
+            breaker.record_success()
+            if response.status_code == 304 and stored:
+                self._etags.hit()
+                return stored[1]
+            if response.status_code == 404 and not_found_ok:
+                return None, None
+            if not response.ok:
+                raise GatewayError(f"{route} returned {response.status_code}",
+                                   response.status_code)
+            page = self._decode(response), response.headers.get(NEXT_PAGE_TOKEN_HEADER)
+            etag = response.headers.get('ETag')
+            if etag:
+                self._etags.put(url, etag, page)
+            return page
+        raise error
+
+    def _attempt_get(self, route, url, timeout, headers):
+        def attempt():
+            return auth.make_authorized_get_request(
+                self._creds(), url, timeout=timeout or self.timeout, headers=headers
+            )
+        if self.hedge_policy is not None and self.hedge_policy.applies(route):
+            return self.hedge_policy.call(route, attempt)
+        return attempt()
+
+    def _decode(self, response):
+        if response.headers.get('Content-Type', '').startswith('application/msgpack'):
+            return msgpack.unpackb(response.content, raw=False)
+        return response.json()
+
+    def _batch_get(self, route, path, key, id_field, ids, timeout):
+        ids = list(dict.fromkeys(ids))
+        found = {}
+        for start in range(0, len(ids), BATCH_GET_MAX_IDS):
+            body = self._post(route, path, json={'ids': ids[start:start + BATCH_GET_MAX_IDS]},
+                              timeout=timeout)
+            for item in body[key]:
+                found[item[id_field]] = item
+        return found
+
+    def _post(self, route, path, timeout=None, **kwargs):
+        breaker = self.breaker(route)
+        if not breaker.allow():
+            raise CircuitOpenError(f"Circuit open for {route}")
+        url = self.base_url + path
+        try:
+            if 'files' in kwargs:
+                response = auth.make_authorized_post_files_request(
+                    self._creds(), url, kwargs['files'], timeout=timeout or self.timeout
+                )
+            else:
+                response = auth.make_authorized_post_request(
+                    self._creds(), url, kwargs['json'], timeout=timeout or self.timeout
+                )
+        except requests.RequestException as e:
+            breaker.record_failure()
+            if deadlines.remaining() == 0:
+                raise deadlines.DeadlineExceeded(f"{route} exceeded the request deadline")
+            raise GatewayError(f"{route} failed: {e}")
+        if response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        if not response.ok:
+            raise GatewayError(f"{route} returned {response.status_code}",
+                               response.status_code)
+        return response.json()
+
+
+def _list_path(path, fields=None, limit=None, page_token=None):
+    # The helpers project lists to ?fields= with Firestore select(), which
+    # cuts both the documents read and the payload. The document ID is
+    # always returned.
+    params = []
+    if fields:
+        params.append('fields=' + ','.join(fields))
+    if limit:
+        params.append(f'limit={limit}')
+    if page_token:
+        params.append('page_token=' + quote(page_token, safe=''))
+    return path + '?' + '&'.join(params) if params else path
+
+
+client = GatewayClient(
+    hedge_policy=HedgePolicy(
+        GATEWAY_HEDGE_ROUTES,
+        percentile=GATEWAY_HEDGE_PERCENTILE,
+        min_delay=GATEWAY_HEDGE_MIN_DELAY,
+        max_ratio=GATEWAY_HEDGE_MAX_RATIO,
+        max_workers=auth.WORKER_THREADS * 2,
+        is_retryable=lambda response: response.status_code in RETRYABLE_STATUS_CODES,
+    ) if GATEWAY_HEDGE else None
+)
+
+
+def course_loader():
+    """
+    Returns the course loader of the current request, see BatchLoader.
+    Courses asked for with course_loader().load(course_id) during the
+    request are fetched together through POST /courses:batchGet.
+    """
+    if 'course_loader' not in g:
+        g.course_loader = BatchLoader(client.batch_get_courses, window=GATEWAY_BATCH_WINDOW,
+                                      max_batch_size=BATCH_GET_MAX_IDS)
+    return g.course_loader
+
+
+def resource_loader():
+    """
+    Returns the resource loader of the current request, see BatchLoader.
+    """
+    if 'resource_loader' not in g:
+        g.resource_loader = BatchLoader(client.batch_get_resources, window=GATEWAY_BATCH_WINDOW,
+                                        max_batch_size=BATCH_GET_MAX_IDS)
+    return g.resource_loader
@@ -23,6 +23,7 @@ import uuid
 
 from google.cloud import firestore
 
+from helpers import deadlines
 from .data_classes import Order
 
 firestore = firestore.Client()
@@ -39,7 +40,7 @@ def add_order(order):
     """
 
     order_id = uuid.uuid4().hex
-    firestore.collection('orders').document(order_id).set(asdict(order))
+    firestore.collection('orders').document(order_id).set(asdict(order), timeout=deadlines.timeout())
     return order_id
 
 
@@ -54,5 +55,5 @@ def get_order(order_id):
        An Order object.
     """
 
-    order_data = firestore.collection('orders').document(order_id).get()
+    order_data = firestore.collection('orders').document(order_id).get(timeout=deadlines.timeout())
     return Order.deserialize(order_data)
@@ -24,6 +24,7 @@ import uuid
 
 from google.cloud import firestore
 
+from helpers import deadlines
 from .data_classes import Product, PromoEntry
 
 BUCKET = os.environ.get('GCS_BUCKET')
@@ -43,7 +44,7 @@ def add_product(product):
     """
 
     product_id = uuid.uuid4().hex
-    firestore_client.collection('products').document(product_id).set(asdict(product))
+    firestore_client.collection('products').document(product_id).set(asdict(product), timeout=deadlines.timeout())
     return product_id
 
 def get_product(product_id):
@@ -57,7 +58,7 @@ def get_product(product_id):
        A Product object.
     """
 
-    product = firestore_client.collection('products').document(product_id).get()
+    product = firestore_client.collection('products').document(product_id).get(timeout=deadlines.timeout())
     return Product.deserialize(product)
 
 
@@ -72,7 +73,7 @@ def list_products():
        A list of Product objects.
     """
 
-    products = firestore_client.collection('products').order_by('created_at').get()
+    products = firestore_client.collection('products').order_by('created_at').get(timeout=deadlines.timeout())
     product_list = [Product.deserialize(product) for product in list(products)]
     return product_list
 
@@ -109,7 +110,7 @@ def get_promos():
     promos = []
     query = firestore_client.collection('promos').where('label', '==', 'pets').where('score', '>=', 0.7)
     query = query.order_by('score', direction=firestore.Query.DESCENDING).limit(3)
-    query_results = query.get()
+    query_results = query.get(timeout=deadlines.timeout())
     for result in query_results:
         entry = PromoEntry.deserialize(result)
         product = get_product(entry.id)
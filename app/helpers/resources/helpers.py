@@ -73,23 +73,7 @@ def list_resources():
     url = f"{CLOUD_FUNCTION_BASE_URL}/resources"
     response = requests.get(url)
     if response.ok:
-        resources_data = response.json()
-        resources = []
-        for res in resources_data:
-            resource = Resource(
-                course_id=res.get('course_id'),
-                title=res.get('title'),
-                type=res.get('type'),
-                url=res.get('url'),
-                description=res.get('description'),
-                uid=res.get('uid'),
-                thumbnail=res.get('thumbnail'),
-                duration=res.get('duration'),
-                document_id=res.get('document_id'),
-                resource_id=res.get('resource_id')
-            )
-            resources.append(resource)
-        return resources
+        return [_resource_from_dict(res) for res in response.json()]
     else:
         response.raise_for_status()
 
@@ -106,26 +90,24 @@ def list_resources_by_course(course_id):
     url = f"{CLOUD_FUNCTION_BASE_URL}/resources/course/{course_id}"
     response = requests.get(url)
     if response.ok:
-        resources_data = response.json()
-        resources = []
-        for res in resources_data:
-            resource = Resource(
-                course_id=res.get('course_id'),
-                title=res.get('title'),
-                type=res.get('type'),
-                url=res.get('url'),
-                description=res.get('description'),
-                uid=res.get('uid'),
-                thumbnail=res.get('thumbnail'),
-                duration=res.get('duration'),
-                document_id=res.get('document_id'),
-                resource_id=res.get('resource_id')
-            )
-            resources.append(resource)
-        return resources
+        return [_resource_from_dict(res) for res in response.json()]
     else:
         response.raise_for_status()
 
+def _resource_from_dict(res):
+    return Resource(
+        course_id=res.get('course_id'),
+        title=res.get('title'),
+        type=res.get('type'),
+        url=res.get('url'),
+        description=res.get('description'),
+        uid=res.get('uid'),
+        thumbnail=res.get('thumbnail'),
+        duration=res.get('duration'),
+        document_id=res.get('document_id'),
+        resource_id=res.get('resource_id')
+    )
+
 def delete_resource(uid, resource_id):
     """
     Deletes a resource based on UID and resource ID. Calls a Cloud Function endpoint.
@@ -18,15 +18,22 @@ This module is the main flask application.
 """
 
 
+import os
+
 import firebase_admin
-from flask import Flask
+from flask import Flask, g, request
 
 from blueprints import *
+from helpers import catalog, deadlines, gateway
+from middlewares.auth import start_cert_prefetch
 
 
 # Initialize Firebase Admin SDK.
 # See https://firebase.google.com/docs/admin/setup for more information.
 firebase = firebase_admin.initialize_app()
+start_cert_prefetch(firebase)
+catalog.start_invalidation_listener()
+catalog.start_event_listener()
 
 
 # Enable Google Cloud Debugger
@@ -39,7 +46,9 @@ firebase = firebase_admin.initialize_app()
 
 
 app = Flask(__name__)
-app.secret_key = b"A Super Secret Key"
+# Set FLASK_SECRET_KEY in production; session mode (see middlewares/auth.py)
+# refuses to run with the built-in key.
+app.secret_key = os.environ.get('FLASK_SECRET_KEY') or b"A Super Secret Key"
 
 
 # app.register_blueprint(cart_page)
@@ -55,5 +64,45 @@ app.register_blueprint(all_resource_page)
 app.register_blueprint(all_course_page)
 app.register_blueprint(healthz_page)
 
+
+@app.before_request
+def start_deadline():
+    """
+    Starts the deadline of the request. A shorter budget sent by the caller
+    in the X-Request-Deadline-Ms header takes precedence.
+    """
+    budget = deadlines.REQUEST_DEADLINE_SECONDS
+    try:
+        budget = min(budget, int(request.headers[deadlines.DEADLINE_HEADER]) / 1000)
+    except (KeyError, ValueError):
+        pass
+    g.deadline_token = deadlines.start(budget)
+
+
+@app.teardown_request
+def clear_deadline(exception=None):
+    token = g.pop('deadline_token', None)
+    if token is not None:
+        deadlines.reset(token)
+
+
+@app.errorhandler(gateway.GatewayError)
+def handle_gateway_error(error):
+    """
+    Answers with 503 when the API Gateway (or a backend behind it) is down or
+    its circuit breaker is open, instead of a bare 500.
+    """
+    return 'The service is temporarily unavailable. Please try again later.', 503
+
+
+@app.errorhandler(deadlines.DeadlineExceeded)
+def handle_deadline_exceeded(error):
+    """
+    Answers with 504 when the request ran out of time waiting on upstream
+    calls.
+    """
+    return 'The request took too long. Please try again later.', 504
+
+
 if __name__ == "__main__":
     app.run(host='0.0.0.0', port=5000, debug=False)
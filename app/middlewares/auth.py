@@ -18,27 +18,131 @@ This module includes decorators for authenticating requests.
 """
 
 
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
 from functools import wraps
-from flask import redirect, request, url_for
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+
+from flask import redirect, request, session, url_for
 
 from firebase_admin import auth
 
+logger = logging.getLogger(__name__)
+
+ID_TOKEN_CACHE_SIZE = int(os.environ.get('ID_TOKEN_CACHE_SIZE', '4096'))
+
+# Opt-in session mode: after a successful verification the auth context is
+# kept in the signed Flask session for AUTH_SESSION_TTL seconds, and the
+# token is only verified again with Firebase when that expires. Revocation
+# is checked at most every AUTH_REVOCATION_CHECK_INTERVAL seconds.
+# Anyone who knows the session signing key can forge a session, so the mode
+# stays off unless the key comes from FLASK_SECRET_KEY (see main.py).
+AUTH_SESSION_MODE = os.environ.get('AUTH_SESSION_MODE', '').lower() in ('1', 'true', 'yes')
+if AUTH_SESSION_MODE and not os.environ.get('FLASK_SECRET_KEY'):
+    logger.warning("AUTH_SESSION_MODE needs FLASK_SECRET_KEY; session mode is off")
+    AUTH_SESSION_MODE = False
+AUTH_SESSION_TTL = int(os.environ.get('AUTH_SESSION_TTL', '300'))
+AUTH_REVOCATION_CHECK_INTERVAL = int(os.environ.get('AUTH_REVOCATION_CHECK_INTERVAL', '900'))
+
+# Google's public keys for Firebase ID tokens.
+ID_TOKEN_CERT_URI = ('https://www.googleapis.com/robot/v1/metadata/x509/'
+                     'securetoken@system.gserviceaccount.com')
 
-def verify_firebase_id_token(token):
+
+class TokenCache:
+    """
+    A bounded LRU cache of verified ID tokens.
+
+    Entries are keyed by a hash of the token, so raw tokens are never kept in
+    memory, and expire with the token's own exp claim.
+
+    Parameters:
+       max_entries (int): The maximum number of cached tokens.
+    """
+
+    def __init__(self, max_entries=ID_TOKEN_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(token):
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def get(self, token):
+        """
+        Returns the cached auth context of a token, or None.
+        """
+        key = self.key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry[0])
+
+    def put(self, token, auth_context, expires_at):
+        """
+        Caches the auth context of a verified token until expires_at.
+        """
+        key = self.key(token)
+        with self._lock:
+            self._entries[key] = (dict(auth_context), expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        """
+        Returns hit/miss counters and the number of cached tokens.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else None,
+                'entries': len(self._entries),
+            }
+
+
+token_cache = TokenCache()
+
+
+def verify_firebase_id_token(token, check_revoked=False):
     """
     A helper function for verifying ID tokens issued by Firebase.
     See https://firebase.google.com/docs/auth/admin/verify-id-tokens for
-    more information.
+    more information. Verified tokens are cached until they expire, so the
+    signature is only checked on the first request that carries a token.
 
     Parameters:
        token (str): A token issued by Firebase.
+       check_revoked (bool): Also check with Firebase that the token has not
+                             been revoked. This bypasses the cache.
 
     Output:
        auth_context (dict): Authentication context.
     """
+    if not check_revoked:
+        auth_context = token_cache.get(token)
+        if auth_context is not None:
+            return auth_context
+
     try:
-        full_auth_context = auth.verify_id_token(token)
-    except ValueError:
+        full_auth_context = auth.verify_id_token(token, check_revoked=check_revoked)
+    except (ValueError, auth.InvalidIdTokenError, auth.UserDisabledError):
         return {}
 
     auth_context = {
@@ -46,9 +150,135 @@ def verify_firebase_id_token(token):
         'uid': full_auth_context.get('uid'),
         'email': full_auth_context.get('email')
     }
+    token_cache.put(token, auth_context, full_auth_context.get('exp', 0))
+    return auth_context
+
+
+def resolve_auth_context(token):
+    """
+    Returns the authentication context for a request's ID token.
+
+    In session mode the context is served from the signed Flask session
+    while it is bound to the same token and younger than AUTH_SESSION_TTL;
+    otherwise the token is verified (with a revocation check when one is
+    due, or when a different user signs in) and the session is renewed.
+    Without session mode this is verify_firebase_id_token.
+
+    Parameters:
+       token (str): A token issued by Firebase.
+
+    Output:
+       auth_context (dict): Authentication context, empty if invalid.
+    """
+    if not AUTH_SESSION_MODE:
+        return verify_firebase_id_token(token)
+
+    now = time.time()
+    token_hash = TokenCache.key(token)
+    entry = session.get('auth')
+    if entry and entry.get('token_hash') == token_hash and now < entry.get('expires_at', 0):
+        return dict(entry['auth_context'])
+
+    auth_context = verify_firebase_id_token(token)
+    revocation_checked_at = entry.get('revocation_checked_at', 0) if entry else 0
+    if auth_context and (
+        not entry
+        or entry['auth_context'].get('uid') != auth_context.get('uid')
+        or now - revocation_checked_at >= AUTH_REVOCATION_CHECK_INTERVAL
+    ):
+        auth_context = verify_firebase_id_token(token, check_revoked=True)
+        revocation_checked_at = now
+
+    if not auth_context:
+        forget_session()
+        return {}
+
+    session['auth'] = {
+        'auth_context': auth_context,
+        'token_hash': token_hash,
+        'expires_at': now + AUTH_SESSION_TTL,
+        'revocation_checked_at': revocation_checked_at,
+    }
     return auth_context
 
 
+def forget_session():
+    """
+    Drops the session-mode auth context, if any. Without session mode the
+    session is left untouched, so that anonymous responses do not vary on it.
+    """
+    if AUTH_SESSION_MODE:
+        session.pop('auth', None)
+
+
+def _cert_freshness(response):
+    # Seconds until the certificates expire per Cache-Control max-age,
+    # measured from the response Date (it may come from the HTTP cache).
+    match = re.search(r'max-age=(\d+)', response.headers.get('cache-control', ''))
+    if not match:
+        return None
+    max_age = int(match.group(1))
+    try:
+        date = parsedate_to_datetime(response.headers['date']).timestamp()
+    except (KeyError, TypeError, ValueError):
+        date = time.time()
+    return date + max_age - time.time()
+
+
+def _prefetch_certs_loop(cert_request):
+    while True:
+        freshness = None
+        try:
+            response = cert_request(ID_TOKEN_CERT_URI, method='GET')
+            freshness = _cert_freshness(response)
+        except Exception as e:
+            logger.warning("Error prefetching ID token certificates: %s", e)
+        # Wake up just after the cached copy goes stale so that the refetch
+        # happens here rather than in a request thread.
+        time.sleep(freshness + 1 if freshness and freshness > 0 else 300)
+
+
+def _cert_request(app):
+    # firebase_admin (6.4) fetches the certificates through a cached HTTP
+    # request held by its private token verifier; there is no public handle.
+    # Every step of the lookup is checked so that an upgrade that moves it
+    # disables the prefetch instead of failing at start-up.
+    get_client = getattr(auth, '_get_client', None)
+    verifier = getattr(get_client(app), '_token_verifier', None) if callable(get_client) else None
+    cert_request = getattr(verifier, 'request', None)
+    if not callable(cert_request):
+        raise AttributeError('firebase_admin has no token verifier request')
+    return cert_request
+
+
+def start_cert_prefetch(app=None):
+    """
+    Pre-fetches Google's public ID token certificates into the HTTP cache
+    that firebase_admin verifies against, and refreshes them in a daemon
+    thread whenever their Cache-Control max-age lapses.
+
+    This is best effort: firebase_admin does not expose its certificate
+    request publicly. If it cannot be found, a warning is logged and
+    verification fetches the certificates on demand as before.
+
+    Parameters:
+       app (App): Optional. The Firebase app; the default app if omitted.
+
+    Output:
+       True if the prefetch thread was started.
+    """
+    try:
+        cert_request = _cert_request(app)
+    except Exception as e:
+        logger.warning("ID token certificate prefetch is unavailable: %s", e)
+        return False
+    threading.Thread(
+        target=_prefetch_certs_loop, args=(cert_request,),
+        name='id-token-cert-prefetch', daemon=True
+    ).start()
+    return True
+
+
 def auth_required(f):
     """
     A decorator for view functions that require authentication.
@@ -65,9 +295,10 @@ def auth_required(f):
     def decorated(*args, **kwargs):
         firebase_id_token = request.cookies.get('firebase_id_token')
         if not firebase_id_token:
+            forget_session()
             return redirect(url_for('product_catalog_page.display'))
 
-        auth_context = verify_firebase_id_token(firebase_id_token)
+        auth_context = resolve_auth_context(firebase_id_token)
         if not auth_context:
             return redirect(url_for('product_catalog_page.display'))
 
@@ -90,9 +321,10 @@ def auth_optional(f):
     def decorated(*args, **kwargs):
         firebase_id_token = request.cookies.get('firebase_id_token')
         if not firebase_id_token:
+            forget_session()
             return f(auth_context=None, *args, **kwargs)
 
-        auth_context = verify_firebase_id_token(firebase_id_token)
+        auth_context = resolve_auth_context(firebase_id_token)
         if not auth_context:
             return f(auth_context=None, *args, **kwargs)
 
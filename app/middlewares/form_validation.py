@@ -22,9 +22,9 @@ from functools import wraps
 
 from flask_wtf import FlaskForm
 from wtforms import FieldList, FloatField, StringField, SelectField, TextAreaField, FileField
-from wtforms.validators import DataRequired, NumberRange, Optional
+from wtforms.validators import DataRequired, NumberRange, Optional, ValidationError
 from flask_wtf.file import FileAllowed
-from helpers import courses, auth
+from helpers import catalog
 from flask import flash
 import logging
 import os
@@ -32,8 +32,6 @@ import os
 # Create a logger instance
 logger = logging.getLogger(__name__)
 
-API_GATEWAY = os.environ.get('API_GATEWAY_URL')
-
 class AddCourseForm(FlaskForm):
     title = StringField('Title', validators=[DataRequired()])
     description = TextAreaField('Description', validators=[DataRequired()])
@@ -55,13 +53,25 @@ def course_form_validation_required(f):
         return f(form=course_upload_form,*args, **kwargs)
     return decorated
     
+def known_course(form, field):
+    """
+    Validates a course ID against the catalog (see catalog.is_course),
+    instead of scanning the choices of the field.
+    """
+    if not catalog.is_course(field.data):
+        raise ValidationError("You must select a course.")
+
+
 class ResourceUploadForm(FlaskForm):
     """
     FlaskForm for uploading resources.
     """
     title = StringField('Title', validators=[DataRequired(message="The title is required.")])
     description = TextAreaField('Description', validators=[DataRequired(message="A description is required.")])
-    course_id = SelectField('Course', coerce=str, validators=[DataRequired(message="You must select a course.")])
+    course_id = SelectField('Course', coerce=str, validate_choice=False, validators=[
+        DataRequired(message="You must select a course."),
+        known_course,
+    ])
     resourceFile = FileField('File', validators=[
         DataRequired(message="A file upload is required."),
         FileAllowed(['png', 'pdf'], message="Only .png and .pdf files are accepted.")
@@ -71,20 +81,6 @@ def resource_form_validation_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
         resource_upload_form = ResourceUploadForm()
-        
-        jwt_cred = auth.generate_creds(
-            sa_keyfile="keyfile.json",
-            sa_email=os.environ.get('JWT_EMAIL'),
-            audience=API_GATEWAY
-        )
-        api_gateway_url = API_GATEWAY + "/courses"
-        response = auth.make_authorized_get_request(
-            jwt_cred,
-            url=api_gateway_url
-        )
-        course_items = response.json()
-
-        resource_upload_form.course_id.choices = [(course['course_id'], course['title']) for course in course_items]
 
         if not resource_upload_form.validate():
             logger.error("Form validation failed: %s", resource_upload_form.errors)
@@ -0,0 +1,90 @@
+# Copyright 2018 Google LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# This module includes a decorator for HTTP caching of pages that look the
+# same for every visitor who is not signed in.
+
+
+from functools import wraps
+import hashlib
+import os
+
+from flask import current_app, make_response, request
+
+# Cache-Control of anonymous pages; the ingress or a CDN may serve them for
+# this long without asking the app.
+ANONYMOUS_CACHE_CONTROL = os.environ.get('ANONYMOUS_CACHE_CONTROL', 'public, max-age=60')
+# Signed-in pages show the user and must never be shared.
+SIGNED_IN_CACHE_CONTROL = 'private, no-cache'
+PAGE_CACHE_VARY = [h.strip() for h in os.environ.get('PAGE_CACHE_VARY', 'Cookie').split(',') if h.strip()]
+
+
+def _templates_version():
+    # Part of every ETag, so that a deploy with changed templates does not
+    # answer 304 to pages rendered by the previous one.
+    digest = hashlib.blake2b(digest_size=8)
+    templates = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates')
+    for root, dirs, files in sorted(os.walk(templates)):
+        dirs.sort()
+        for name in sorted(files):
+            with open(os.path.join(root, name), 'rb') as f:
+                digest.update(name.encode())
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+TEMPLATES_VERSION = _templates_version()
+
+
+def anonymous_page_cache(version):
+    """
+    A decorator for views (below auth_optional) whose page only depends on
+    the catalog when nobody is signed in.
+
+    Anonymous responses get an ETag derived from version() and
+    ANONYMOUS_CACHE_CONTROL, and a conditional GET with a matching
+    If-None-Match is answered with 304 without calling the view. Signed-in
+    responses are marked private.
+
+    Parameters:
+       version (func): Returns a string that changes whenever the anonymous
+                       page would, e.g. the versions of the catalog lists.
+
+    Output:
+       decorator (func): The decorator.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, auth_context=None, **kwargs):
+            if auth_context:
+                response = make_response(f(*args, auth_context=auth_context, **kwargs))
+                response.headers['Cache-Control'] = SIGNED_IN_CACHE_CONTROL
+                response.vary.update(PAGE_CACHE_VARY)
+                return response
+
+            key = '|'.join([request.path, TEMPLATES_VERSION, version()])
+            etag = hashlib.blake2b(key.encode(), digest_size=12).hexdigest()
+            if request.if_none_match.contains(etag):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(f(*args, auth_context=None, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = ANONYMOUS_CACHE_CONTROL
+            response.vary.update(PAGE_CACHE_VARY)
+            return response
+        return decorated
+    return decorator
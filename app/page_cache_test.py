@@ -0,0 +1,76 @@
+# Copyright 2018 Google LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for HTTP caching of anonymous pages.
+"""
+
+
+import flask
+
+from middlewares.page_cache import anonymous_page_cache
+
+
+def make_app(version):
+    app = flask.Flask(__name__)
+    calls = []
+
+    @app.route('/')
+    @anonymous_page_cache(lambda: version[0])
+    def page(auth_context=None):
+        calls.append(auth_context)
+        return 'hello'
+
+    return app, calls
+
+
+def test_anonymous_pages_answer_conditional_gets_with_304():
+    """
+    Should send an ETag and answer a matching If-None-Match without
+    calling the view, until the version changes.
+    """
+    version = ['v1']
+    app, calls = make_app(version)
+    client = app.test_client()
+
+    first = client.get('/')
+    assert first.status_code == 200
+    assert first.headers['Cache-Control'] == 'public, max-age=60'
+    assert 'Cookie' in first.headers['Vary']
+    etag = first.headers['ETag']
+
+    second = client.get('/', headers={'If-None-Match': etag})
+    assert second.status_code == 304
+    assert len(calls) == 1
+
+    version[0] = 'v2'
+    third = client.get('/', headers={'If-None-Match': etag})
+    assert third.status_code == 200
+    assert third.headers['ETag'] != etag
+
+
+def test_signed_in_pages_are_private():
+    """
+    Should mark pages of signed-in users private and skip validators.
+    """
+    app = flask.Flask(__name__)
+
+    @anonymous_page_cache(lambda: 'v1')
+    def page(auth_context=None):
+        return 'hello ' + auth_context['uid']
+
+    with app.test_request_context('/'):
+        response = page(auth_context={'uid': 'u1'})
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+    assert 'ETag' not in response.headers
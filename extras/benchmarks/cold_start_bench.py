@@ -0,0 +1,129 @@
+# Copyright 2018 Google LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Measures the cold start of the Python helper functions: the time to import
+each function's main.py and the latency of its first and of a warm request,
+each run in a fresh interpreter. With --warm-up, WARM_UP_ON_START is set so
+that the set-up moves from the first request into the import.
+
+The requests are real: course_helper and resource_helper need Firestore
+(credentials or FIRESTORE_EMULATOR_HOST), upload_image needs GCS_BUCKET.
+"""
+
+
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+FUNCTIONS_DIR = os.path.join(ROOT, 'functions')
+SAMPLE_IMAGE = os.path.join(ROOT, 'extras', 'sample_images', 'course.png')
+
+
+def course_helper_request(main):
+    return main.app.test_client().get('/courses?limit=1').status_code
+
+
+def resource_helper_request(main):
+    return main.app.test_client().get('/resources?limit=1').status_code
+
+
+def upload_image_request(main):
+    import flask
+
+    with open(SAMPLE_IMAGE, 'rb') as f:
+        data = f.read()
+    app = flask.Flask('cold_start_bench')
+    with app.test_request_context('/', method='POST', data={
+        'filepond': (io.BytesIO(data), 'course.png', 'image/png'),
+    }):
+        return main.upload_image(flask.request)[1]
+
+
+REQUESTS = {
+    'course_helper': course_helper_request,
+    'resource_helper': resource_helper_request,
+    'upload_image': upload_image_request,
+}
+
+
+def child(function, n_requests):
+    """
+    Runs in a fresh interpreter: imports the function, sends n_requests
+    requests and prints the timings as JSON.
+    """
+    sys.path.insert(0, os.path.join(FUNCTIONS_DIR, function))
+    # Where the predeploy hook would have copied helper_common.py.
+    sys.path.insert(1, os.path.join(FUNCTIONS_DIR, 'shared'))
+    start = time.perf_counter()
+    import main
+    import_seconds = time.perf_counter() - start
+
+    latencies, statuses = [], []
+    for _ in range(n_requests):
+        start = time.perf_counter()
+        statuses.append(REQUESTS[function](main))
+        latencies.append(time.perf_counter() - start)
+    print(json.dumps({'import': import_seconds, 'requests': latencies, 'statuses': statuses}))
+
+
+def run(function, n_requests, warm_up):
+    env = dict(os.environ)
+    if warm_up:
+        env['WARM_UP_ON_START'] = '1'
+    else:
+        env.pop('WARM_UP_ON_START', None)
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', function,
+         '--requests', str(n_requests)],
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--functions', default=','.join(REQUESTS),
+                        help='comma-separated functions to measure')
+    parser.add_argument('--runs', type=int, default=5, help='cold starts per function')
+    parser.add_argument('--requests', type=int, default=3, help='requests per cold start')
+    parser.add_argument('--warm-up', action='store_true', help='set WARM_UP_ON_START')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.requests)
+        return
+
+    print(f"{'function':<18}{'import ms':>12}{'first req ms':>15}{'warm req ms':>14}  statuses")
+    for function in args.functions.split(','):
+        results = [run(function, args.requests, args.warm_up) for _ in range(args.runs)]
+        imports = [r['import'] * 1000 for r in results]
+        firsts = [r['requests'][0] * 1000 for r in results]
+        warms = [t * 1000 for r in results for t in r['requests'][1:]]
+        statuses = sorted({s for r in results for s in r['statuses']})
+        print(f"{function:<18}{statistics.median(imports):>12.1f}"
+              f"{statistics.median(firsts):>15.1f}"
+              f"{statistics.median(warms) if warms else float('nan'):>14.1f}  {statuses}")
+
+
+if __name__ == '__main__':
+    main()
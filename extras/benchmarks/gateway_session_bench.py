@@ -0,0 +1,94 @@
+# Copyright 2018 Google LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Compares cold-connection and pooled latency of GET /courses.
+
+The cold run opens a new requests.Session (and therefore a new TCP+TLS
+connection) per call, which is what the app did before the pooled session
+in helpers.auth. The pooled run goes through helpers.auth unchanged.
+"""
+
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'app'))
+
+from helpers import auth  # noqa: E402
+
+
+def percentile(samples, q):
+    """
+    Returns the q-th percentile (0-100) of a list of samples.
+    """
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_cold(jwt_cred, url, n):
+    samples = []
+    for _ in range(n):
+        headers = {}
+        jwt_cred.before_request(None, 'GET', url, headers)
+        start = time.perf_counter()
+        with requests.Session() as session:
+            session.get(url, headers=headers, timeout=auth.GATEWAY_TIMEOUT).raise_for_status()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def run_pooled(jwt_cred, url, n):
+    # Open the pooled connection once so that the run measures steady state.
+    auth.make_authorized_get_request(jwt_cred, url).raise_for_status()
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        auth.make_authorized_get_request(jwt_cred, url).raise_for_status()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(name, samples):
+    print(f"{name:>7}: n={len(samples)} "
+          f"p50={percentile(samples, 50):.1f}ms "
+          f"p99={percentile(samples, 99):.1f}ms "
+          f"mean={statistics.mean(samples):.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--gateway', default=os.environ.get('API_GATEWAY_URL'))
+    parser.add_argument('--keyfile', default='keyfile.json')
+    parser.add_argument('--path', default='/courses')
+    parser.add_argument('-n', type=int, default=100)
+    args = parser.parse_args()
+    if not args.gateway:
+        parser.error('--gateway or API_GATEWAY_URL is required')
+
+    jwt_cred = auth.get_creds(args.gateway, sa_keyfile=args.keyfile)
+    url = args.gateway + args.path
+    report('cold', run_cold(jwt_cred, url, args.n))
+    report('pooled', run_pooled(jwt_cred, url, args.n))
+
+
+if __name__ == '__main__':
+    main()
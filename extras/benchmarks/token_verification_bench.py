@@ -0,0 +1,102 @@
+# Copyright 2018 Google LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Measures ID token verification throughput of middlewares.auth with and
+without the verified-token cache.
+
+Real Firebase tokens cannot be minted offline, so firebase_admin's
+verify_id_token is replaced with an equivalent RS256 verification
+(google.auth.jwt.decode against a locally generated key), which is the
+dominant cost of the real call once certificates are cached.
+"""
+
+
+import argparse
+import os
+import sys
+import time
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+import google.auth.crypt
+import google.auth.jwt
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'app'))
+
+from middlewares import auth as auth_middleware  # noqa: E402
+
+
+def make_key():
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode()
+    public_pem = key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo,
+    ).decode()
+    return google.auth.crypt.RSASigner.from_string(private_pem, key_id='bench'), public_pem
+
+
+def make_tokens(signer, n):
+    now = int(time.time())
+    return [google.auth.jwt.encode(signer, {
+        'iss': 'https://securetoken.google.com/bench',
+        'aud': 'bench',
+        'sub': f'user-{i}',
+        'uid': f'user-{i}',
+        'name': f'User {i}',
+        'email': f'user-{i}@example.com',
+        'iat': now,
+        'exp': now + 3600,
+    }).decode() for i in range(n)]
+
+
+def throughput(tokens, requests_per_token):
+    start = time.perf_counter()
+    for _ in range(requests_per_token):
+        for token in tokens:
+            assert auth_middleware.verify_firebase_id_token(token)
+    elapsed = time.perf_counter() - start
+    return len(tokens) * requests_per_token / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--requests-per-user', type=int, default=20)
+    args = parser.parse_args()
+
+    signer, public_pem = make_key()
+    tokens = make_tokens(signer, args.users)
+    auth_middleware.auth.verify_id_token = lambda token: google.auth.jwt.decode(
+        token, certs=public_pem, audience='bench'
+    )
+
+    auth_middleware.token_cache = auth_middleware.TokenCache(max_entries=0)
+    uncached = throughput(tokens, args.requests_per_user)
+    auth_middleware.token_cache = auth_middleware.TokenCache()
+    cached = throughput(tokens, args.requests_per_user)
+
+    print(f"uncached: {uncached:,.0f} verifications/s")
+    print(f"  cached: {cached:,.0f} verifications/s ({cached / uncached:.0f}x)")
+    print(f"   cache: {auth_middleware.token_cache.stats()}")
+
+
+if __name__ == '__main__':
+    main()
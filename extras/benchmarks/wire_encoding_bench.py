@@ -0,0 +1,114 @@
+# Copyright 2018 Google LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+Measures bytes on the wire and client decode time of catalog lists for the
+encodings the helper functions can negotiate (JSON or MessagePack, each
+uncompressed, gzip or brotli). Encodings whose module is not installed are
+skipped.
+"""
+
+
+import argparse
+import gzip
+import json
+import random
+import string
+import time
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def make_catalog(n, seed=0):
+    """
+    Returns n resource-shaped dicts similar to what resource_helper serves.
+    """
+    rng = random.Random(seed)
+    words = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9)))
+             for _ in range(2000)]
+
+    def text(k):
+        return ' '.join(rng.choice(words) for _ in range(k))
+
+    return [{
+        'resource_id': '%032x' % rng.getrandbits(128),
+        'course_id': '%020x' % rng.getrandbits(80),
+        'title': text(4),
+        'type': rng.choice(['image/png', 'application/pdf']),
+        'url': 'https://storage.googleapis.com/bucket/%032x.pdf' % rng.getrandbits(128),
+        'description': text(rng.randint(20, 80)),
+        'uid': '%028x' % rng.getrandbits(112),
+        'thumbnail': 'resource_1',
+        'duration': None,
+    } for _ in range(n)]
+
+
+def encodings():
+    """
+    Returns (name, encode, decode) triples for the available encodings.
+    """
+    serializers = [('json', lambda d: json.dumps(d, separators=(',', ':')).encode(),
+                    lambda b: json.loads(b))]
+    if msgpack is not None:
+        serializers.append(('msgpack', lambda d: msgpack.packb(d, use_bin_type=True),
+                            lambda b: msgpack.unpackb(b, raw=False)))
+    compressors = [('', lambda b: b, lambda b: b),
+                   ('+gzip', lambda b: gzip.compress(b, 6), gzip.decompress)]
+    if brotli is not None:
+        compressors.append(('+br', lambda b: brotli.compress(b, quality=5), brotli.decompress))
+
+    for s_name, s_enc, s_dec in serializers:
+        for c_name, c_enc, c_dec in compressors:
+            yield (s_name + c_name,
+                   lambda d, s_enc=s_enc, c_enc=c_enc: c_enc(s_enc(d)),
+                   lambda b, s_dec=s_dec, c_dec=c_dec: s_dec(c_dec(b)))
+
+
+def best_of(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='1000,10000,100000')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'items':>7} {'encoding':<13} {'bytes':>12} {'ratio':>6} {'decode ms':>10}")
+    for n in [int(size) for size in args.sizes.split(',')]:
+        catalog = make_catalog(n)
+        baseline = None
+        for name, encode, decode in encodings():
+            body = encode(catalog)
+            baseline = baseline or len(body)
+            decode_time = best_of(lambda: decode(body), args.repeat)
+            print(f"{n:>7} {name:<13} {len(body):>12,} {len(body) / baseline:>6.2f} "
+                  f"{decode_time * 1000:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,304 @@
+# Copyright 2018 Google LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+A local stand-in for the API Gateway (extras/apiConfig.yaml) and the helper
+functions behind it, backed by an in-memory dataset, with per-route latency,
+error and timeout injection for load and tail-latency testing.
+"""
+
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+
+import flask
+from flask import jsonify
+
+
+app = flask.Flask(__name__)
+
+_lock = threading.Lock()
+courses = {}
+resources = {}
+
+# Fault profile: {"default": {...}, "routes": {"GET /courses": {...}}}.
+# Each entry may set:
+#   latency        "fixed:MS" | "uniform:LO_MS:HI_MS" | "normal:MEAN_MS:SD_MS"
+#                  | "lognormal:MEDIAN_MS:SIGMA"
+#   slow_rate      probability of drawing from slow_latency instead
+#   slow_latency   same syntax as latency, e.g. to model cold starts
+#   error_rate     probability of answering error_status
+#   error_status   status of injected errors (default 503)
+#   timeout_rate   probability of hanging for timeout_seconds, then 504
+#   timeout_seconds
+profile = {"default": {}, "routes": {}}
+
+
+def sample_latency(spec):
+    """
+    Draws a latency in seconds from a distribution spec (see profile).
+    """
+    if not spec:
+        return 0.0
+    kind, *params = spec.split(':')
+    params = [float(p) for p in params]
+    if kind == 'fixed':
+        ms = params[0]
+    elif kind == 'uniform':
+        ms = random.uniform(params[0], params[1])
+    elif kind == 'normal':
+        ms = random.gauss(params[0], params[1])
+    elif kind == 'lognormal':
+        ms = params[0] * random.lognormvariate(0, params[1])
+    else:
+        raise ValueError(f"Unknown latency distribution: {spec}")
+    return max(ms, 0.0) / 1000
+
+
+def route_config(route):
+    return {**profile.get('default', {}), **profile.get('routes', {}).get(route, {})}
+
+
+@app.before_request
+def inject_faults():
+    """
+    Applies the fault profile of the matched route before it is served.
+    """
+    if flask.request.url_rule is None or flask.request.path.startswith('/_fault'):
+        return None
+    config = route_config(f"{flask.request.method} {flask.request.url_rule.rule}")
+
+    if random.random() < config.get('timeout_rate', 0):
+        time.sleep(config.get('timeout_seconds', 30))
+        return {"error": "Injected timeout"}, 504
+
+    if random.random() < config.get('slow_rate', 0):
+        time.sleep(sample_latency(config.get('slow_latency')))
+    else:
+        time.sleep(sample_latency(config.get('latency')))
+
+    if random.random() < config.get('error_rate', 0):
+        return {"error": "Injected error"}, config.get('error_status', 503)
+    return None
+
+
+def conditional_json(data):
+    response = jsonify(data)
+    response.add_etag()
+    return response.make_conditional(flask.request)
+
+
+def list_json(items):
+    # Same ?fields= projection, ?limit=&page_token= paging and negotiation
+    # as the helpers: NDJSON only when asked for. The stored items carry
+    # their IDs as fields; page tokens are plain offsets here.
+    args = flask.request.args
+    next_page_token = None
+    if 'limit' in args:
+        start = int(args.get('page_token') or 0)
+        end = start + int(args['limit'])
+        if end < len(items):
+            next_page_token = str(end)
+        items = items[start:end]
+    fields = args.get('fields')
+    if fields:
+        fields = set(fields.split(','))
+        items = [{k: v for k, v in item.items() if k in fields} for item in items]
+    if flask.request.accept_mimetypes.best_match(
+        ["application/json", "application/x-ndjson"]
+    ) == "application/x-ndjson":
+        return flask.Response((flask.json.dumps(item) + "\n" for item in items),
+                              mimetype="application/x-ndjson")
+    response = conditional_json(list(items))
+    if next_page_token:
+        response.headers['X-Next-Page-Token'] = next_page_token
+    return response
+
+
+@app.get("/courses")
+@app.get("/courses/<course_id>")
+def get_course(course_id=None):
+    if course_id is not None:
+        course = courses.get(course_id)
+        if course is None:
+            return {"error": "Document not found"}, 404
+        return conditional_json(course)
+    return list_json(sorted(courses.values(), key=lambda c: c.get('title') or ''))
+
+
+def batch_get(items, key):
+    data = flask.request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    if not isinstance(ids, list) or len(ids) > 100:
+        return jsonify({"error": "ids must be a list of at most 100 document IDs"}), 400
+    ids = list(dict.fromkeys(ids))
+    return jsonify({
+        key: [items[i] for i in ids if i in items],
+        "missing": [i for i in ids if i not in items],
+    })
+
+
+@app.post("/courses:batchGet")
+def batch_get_courses():
+    return batch_get(courses, 'courses')
+
+
+@app.post("/courses")
+def add_course():
+    data = flask.request.get_json()
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+    course_id = uuid.uuid4().hex
+    with _lock:
+        courses[course_id] = {**data, "course_id": course_id}
+    return jsonify({"success": True, "doc_id": course_id}), 201
+
+
+@app.get("/resources")
+@app.get("/resources/<resource_id>")
+def get_resource(resource_id=None):
+    if resource_id is not None:
+        resource = resources.get(resource_id)
+        if resource is None:
+            return {"error": "Document not found"}, 404
+        return conditional_json(resource)
+    return list_json(sorted(resources.values(), key=lambda r: r.get('title') or ''))
+
+
+@app.post("/resources:batchGet")
+def batch_get_resources():
+    return batch_get(resources, 'resources')
+
+
+@app.get("/resources/course/<course_id>")
+def list_resources_by_course(course_id):
+    return list_json(
+        [r for r in resources.values() if r.get('course_id') == course_id]
+    )
+
+
+@app.post("/resources")
+def add_resource():
+    data = flask.request.get_json()
+    if not data:
+        return jsonify({"error": "No data provided"}), 400
+    resource_id = data.get('resource_id') or uuid.uuid4().hex
+    with _lock:
+        resources[resource_id] = {**data, "resource_id": resource_id}
+    return jsonify({"success": True, "doc_id": resource_id}), 201
+
+
+@app.post("/upload_image")
+def upload_image():
+    file = flask.request.files.get('filepond')
+    if not file:
+        return "File is not found in the request.", 400
+    resource_id = uuid.uuid4().hex
+    extension = 'pdf' if file.content_type == 'application/pdf' else 'png'
+    return jsonify({
+        'resource_id': resource_id,
+        'url': f'https://storage.googleapis.com/fake-bucket/{resource_id}.{extension}',
+    }), 200
+
+
+@app.get("/_fault")
+def get_profile():
+    """
+    Returns the active fault profile.
+    """
+    return jsonify(profile)
+
+
+@app.put("/_fault")
+def put_profile():
+    """
+    Replaces the fault profile at runtime, e.g. to start an incident in the
+    middle of a soak test.
+    """
+    data = flask.request.get_json()
+    profile.clear()
+    profile.update({"default": data.get("default", {}), "routes": data.get("routes", {})})
+    return jsonify(profile)
+
+
+def seed(n_courses, resources_per_course, rng_seed=0):
+    """
+    Fills the dataset with generated courses and resources.
+    """
+    rng = random.Random(rng_seed)
+    fields = ['Computer Science', 'Mathematics', 'Physics', 'History', 'Biology']
+    for i in range(n_courses):
+        course_id = '%020x' % rng.getrandbits(80)
+        courses[course_id] = {
+            'course_id': course_id,
+            'title': f'Course {i:05d}',
+            'description': 'Lorem ipsum dolor sit amet. ' * rng.randint(5, 40),
+            'instructor': f'Instructor {rng.randint(1, 200)}',
+            'field': rng.choice(fields),
+            'level': rng.choice(['Beginner', 'Intermediate', 'Advanced']),
+            'language': 'English',
+            'thumbnailUrl': 'course',
+            'uid': '%028x' % rng.getrandbits(112),
+            'ratingsAverage': '%.1f' % rng.uniform(1, 4.9),
+            'ratingsCount': str(rng.randint(1, 1000)),
+        }
+        for j in range(resources_per_course):
+            resource_id = '%032x' % rng.getrandbits(128)
+            resources[resource_id] = {
+                'resource_id': resource_id,
+                'course_id': course_id,
+                'title': f'Resource {i:05d}-{j:02d}',
+                'type': rng.choice(['image/png', 'application/pdf']),
+                'url': f'https://storage.googleapis.com/fake-bucket/{resource_id}.pdf',
+                'description': 'Lorem ipsum dolor sit amet. ' * rng.randint(2, 20),
+                'uid': '%028x' % rng.getrandbits(112),
+                'thumbnail': 'resource_1',
+                'duration': None,
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--courses', type=int, default=100)
+    parser.add_argument('--resources-per-course', type=int, default=5)
+    parser.add_argument('--data', help='JSON file with "courses" and "resources" lists')
+    parser.add_argument('--profile', help='JSON fault profile, see profiles/')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    if args.data:
+        with open(args.data) as f:
+            data = json.load(f)
+        courses.update({c['course_id']: c for c in data.get('courses', [])})
+        resources.update({r['resource_id']: r for r in data.get('resources', [])})
+    else:
+        seed(args.courses, args.resources_per_course, args.seed)
+    if args.profile:
+        with open(args.profile) as f:
+            data = json.load(f)
+        profile.update({"default": data.get("default", {}), "routes": data.get("routes", {})})
+
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+# Copyright 2018 Google LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the course helper. Run from this directory.
+"""
+
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+import helper_common
+import main
+
+
+class FakeDocument:
+    def __init__(self, id, data):
+        self.id = id
+        self.exists = True
+        self._data = data
+
+    def get(self, field):
+        return self._data[field]
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+def order_key(title, id):
+    # Firestore orders null before any string.
+    return (title is not None, title or "", id)
+
+
+class FakeQuery:
+    """
+    The subset of a Firestore query used by run_list_query, over documents
+    already ordered by (title, document ID).
+    """
+
+    def __init__(self, documents):
+        self.documents = documents
+
+    def order_by(self, field):
+        return self
+
+    def start_after(self, cursor):
+        after = order_key(cursor["title"], cursor["__name__"])
+        return FakeQuery([d for d in self.documents if order_key(d.get("title"), d.id) > after])
+
+    def limit(self, n):
+        return FakeQuery(self.documents[:n])
+
+    def select(self, fields):
+        return FakeQuery([FakeDocument(d.id, {k: v for k, v in d.to_dict().items() if k in fields})
+                          for d in self.documents])
+
+    def get(self, timeout=None):
+        return list(self.documents)
+
+    stream = get
+
+
+class FakeClient:
+    def __init__(self, documents):
+        self.documents = sorted(documents, key=lambda d: order_key(d.get("title"), d.id))
+
+    def collection(self, name):
+        return FakeQuery(self.documents)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    documents = [FakeDocument("c%02d" % i, {"title": "Course %d" % (i // 2), "level": "1"})
+                 for i in range(7)]
+    monkeypatch.setattr(main, "db", lambda: FakeClient(documents))
+    return main.app.test_client()
+
+
+def test_page_token_round_trip():
+    """
+    Should decode what it encodes.
+    """
+    cursor = {"title": "Course 1", "__name__": "c03"}
+    assert helper_common.decode_page_token(helper_common.encode_page_token(cursor), {"title": str}) == cursor
+
+
+def test_pages_cover_the_list_once(client):
+    """
+    Should walk every course once, in order, following X-Next-Page-Token.
+    """
+    seen, token, pages = [], None, 0
+    while True:
+        url = "/courses?limit=3" + (f"&page_token={token}" if token else "")
+        response = client.get(url, headers={"Accept": "application/json"})
+        assert response.status_code == 200
+        seen += [course["course_id"] for course in response.get_json()]
+        pages += 1
+        token = response.headers.get(helper_common.NEXT_PAGE_TOKEN_HEADER)
+        if not token:
+            break
+    assert seen == ["c%02d" % i for i in range(7)]
+    assert pages == 3
+
+
+def test_pages_continue_past_untitled_courses(monkeypatch):
+    """
+    Should accept the token it issues after a course whose title is null.
+    """
+    documents = [FakeDocument("c%02d" % i, {"title": None if i < 3 else "Course %d" % i})
+                 for i in range(5)]
+    monkeypatch.setattr(main, "db", lambda: FakeClient(documents))
+    client = main.app.test_client()
+    response = client.get("/courses?limit=2")
+    token = response.headers[helper_common.NEXT_PAGE_TOKEN_HEADER]
+    assert helper_common.decode_page_token(token, {"title": str}) == {"title": None, "__name__": "c01"}
+    response = client.get(f"/courses?limit=2&page_token={token}")
+    assert response.status_code == 200
+    assert [course["course_id"] for course in response.get_json()] == ["c02", "c03"]
+
+
+def test_unpaged_list_has_no_token(client):
+    """
+    Should return the whole list without a next page token.
+    """
+    response = client.get("/courses")
+    assert len(response.get_json()) == 7
+    assert helper_common.NEXT_PAGE_TOKEN_HEADER not in response.headers
+
+
+@pytest.mark.parametrize("limit", ["0", str(helper_common.MAX_PAGE_SIZE + 1), "ten"])
+def test_limit_out_of_bounds_is_rejected(client, limit):
+    """
+    Should answer 400 to a limit outside 1..MAX_PAGE_SIZE.
+    """
+    assert client.get(f"/courses?limit={limit}").status_code == 400
+
+
+@pytest.mark.parametrize("cursor", [
+    {"__name__": "c01"},                                  # Missing order field.
+    {"title": 3, "__name__": "c01"},                      # Wrong type.
+    {"title": "Course 0", "__name__": "a/b"},             # Not a document ID.
+    {"title": "Course 0", "__name__": "c01", "x": 1},     # Extra field.
+])
+def test_invalid_page_tokens_are_rejected(client, cursor):
+    """
+    Should answer 400, not fail in Firestore, for a token that does not
+    match the query's order fields.
+    """
+    token = helper_common.encode_page_token(cursor)
+    assert client.get(f"/courses?limit=2&page_token={token}").status_code == 400
+    assert client.get("/courses?limit=2&page_token=not-base64!").status_code == 400
+
+
+def test_ndjson_stream_is_gzipped_when_accepted(client):
+    """
+    Should stream one course per line, gzip-compressed if accepted.
+    """
+    import gzip
+    import json
+
+    response = client.get("/courses", headers={"Accept": helper_common.NDJSON_MIMETYPE,
+                                               "Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    lines = gzip.decompress(response.get_data()).decode().splitlines()
+    assert [json.loads(line)["course_id"] for line in lines] == ["c%02d" % i for i in range(7)]
+
+    response = client.get("/courses", headers={"Accept": helper_common.NDJSON_MIMETYPE})
+    assert "Content-Encoding" not in response.headers
+    assert len(response.get_data().splitlines()) == 7
+
+
+def test_google_api_core_is_not_imported_at_module_load():
+    """
+    Should leave google.api_core (and gRPC) to the first Firestore call.
+    """
+    code = "import main, sys; print(sorted(m for m in sys.modules if m.startswith(('google.api_core', 'grpc'))))"
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(helper_common.__file__))
+    output = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                            env=env, capture_output=True, text=True, check=True).stdout
+    assert output.strip() == "[]"
+
+
+def test_deadline_exceeded_is_answered_with_504(client, monkeypatch):
+    """
+    Should map a Firestore DeadlineExceeded to 504.
+    """
+    from google.api_core.exceptions import DeadlineExceeded
+
+    def get(self, timeout=None):
+        raise DeadlineExceeded("timed out")
+    monkeypatch.setattr(FakeQuery, "get", get)
+    monkeypatch.setattr(FakeQuery, "stream", get)
+    response = client.get("/courses")
+    assert response.status_code == 504
+    assert response.get_json() == {"error": "Deadline exceeded"}
@@ -2,7 +2,6 @@
 # To get started, simply uncomment the below code or create your own.
 # Deploy with `firebase deploy`
 
-from firebase_admin import initialize_app, firestore
 from firebase_functions import https_fn
 import flask
 from flask import jsonify
@@ -10,6 +9,19 @@ from flask import jsonify
 from dataclasses import asdict, dataclass, field
 from typing import Optional
 
+from helper_common import (
+    BATCH_GET_MAX_IDS,
+    WARM_UP_ON_START,
+    conditional_json,
+    create_app,
+    db,
+    firestore_timeout,
+    list_response,
+    requested_fields,
+    run_list_query,
+    warm_up,
+)
+
 
 @dataclass
 class Course:
@@ -49,8 +61,17 @@ class Course:
         )
 
 
-initialize_app()
-app = flask.Flask(__name__)
+def course_dict(document):
+    # The document's fields plus its ID.
+    document_data = document.to_dict()
+    document_data["course_id"] = document.id
+    return document_data
+
+
+if WARM_UP_ON_START:
+    warm_up("courses")
+
+app = create_app(__name__)
 
 # Build multiple CRUD interfaces:
 
@@ -61,27 +82,50 @@ def get_course(course_id=None):
     if course_id is not None:
         # Retrieve a single document by its ID
         document_snapshot = (
-            firestore.client().collection("courses").document(course_id).get()
+            db().collection("courses").document(course_id).get(timeout=firestore_timeout())
         )
         if document_snapshot.exists:
             document_data = document_snapshot.to_dict()
             document_data["course_id"] = (
                 document_snapshot.id
             )  # Add the document ID to the response
-            return document_data
+            return conditional_json(document_data)
         else:
             return {"error": "Document not found"}, 404
     else:
-        # Retrieve all documents in the collection, ordered by title
-        documents = firestore.client().collection("courses").order_by("title").get()
-        documents_list = []
-        for document in documents:
-            document_data = document.to_dict()
-            document_data["course_id"] = (
-                document.id
-            )  # Add the document ID to each document's data
-            documents_list.append(document_data)
-        return documents_list
+        # Retrieve all documents in the collection (or a page), ordered by title
+        query = db().collection("courses").order_by("title")
+        documents, next_page_token = run_list_query(query, {"title": str})
+        return list_response(documents, course_dict, next_page_token)
+
+
+@app.post("/courses:batchGet")
+def batch_get_courses():
+    """
+    Returns the courses with the given IDs in one Firestore round trip.
+    Body: {"ids": [...]}, at most BATCH_GET_MAX_IDS IDs.
+    """
+    data = flask.request.get_json(silent=True) or {}
+    ids = data.get("ids")
+    if (not isinstance(ids, list) or len(ids) > BATCH_GET_MAX_IDS
+            or not all(isinstance(i, str) and i and "/" not in i for i in ids)):
+        return jsonify({"error": f"ids must be a list of at most {BATCH_GET_MAX_IDS} document IDs"}), 400
+
+    ids = list(dict.fromkeys(ids))
+    collection = db().collection("courses")
+    snapshots = db().get_all(
+        [collection.document(i) for i in ids], timeout=firestore_timeout()
+    )
+    found = {}
+    for snapshot in snapshots:
+        if snapshot.exists:
+            document_data = snapshot.to_dict()
+            document_data["course_id"] = snapshot.id
+            found[snapshot.id] = document_data
+    return conditional_json({
+        "courses": [found[i] for i in ids if i in found],
+        "missing": [i for i in ids if i not in found],
+    })
 
 
 @app.post("/courses")
@@ -90,20 +134,20 @@ def add_resource():
     if not data:
         return jsonify({"error": "No data provided"}), 400
 
-    doc_ref = firestore.client().collection("courses").document()
-    write_result = doc_ref.set(data)  # This line actually writes the data to Firestore
+    doc_ref = db().collection("courses").document()
+    write_result = doc_ref.set(data, timeout=firestore_timeout())  # This line actually writes the data to Firestore
     return jsonify({"success": True, "doc_id": doc_ref.id}), 201
 
 
 @app.delete("/courses/<course_id>/<uid>")
 def delete_resource_endpoint(course_id, uid):
-    course_ref = firestore.client.collection('courses').document(course_id)
-    course_doc = course_ref.get()
+    course_ref = db().collection('courses').document(course_id)
+    course_doc = course_ref.get(timeout=firestore_timeout())
     if course_doc.exists:
         course_data = course_doc.to_dict()
         if course_data['uid'] == uid:
             # Delete the course
-            course_ref.delete()
+            course_ref.delete(timeout=firestore_timeout())
             return jsonify({"message": "Resource deleted"}), 200
         else:
             return jsonify({"message": "Unauthorized"}), 401
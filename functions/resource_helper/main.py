@@ -2,7 +2,6 @@
 # To get started, simply uncomment the below code or create your own.
 # Deploy with `firebase deploy`
 
-from firebase_admin import initialize_app, firestore
 from firebase_functions import https_fn
 import flask
 from flask import jsonify
@@ -10,6 +9,20 @@ from flask import jsonify
 from dataclasses import asdict, dataclass, field
 from typing import Optional
 
+from helper_common import (
+    BATCH_GET_MAX_IDS,
+    WARM_UP_ON_START,
+    conditional_json,
+    create_app,
+    db,
+    firestore_timeout,
+    list_response,
+    requested_fields,
+    run_list_query,
+    warm_up,
+)
+
+
 # Assuming the Resource dataclass is defined here for simplicity
 @dataclass
 class Resource:
@@ -40,8 +53,18 @@ class Resource:
             resource_id=document.id,
         )
 
-initialize_app()
-app = flask.Flask(__name__)
+
+def resource_dict(document):
+    # The document's fields plus its ID.
+    document_data = document.to_dict()
+    document_data["resource_id"] = document.id
+    return document_data
+
+
+if WARM_UP_ON_START:
+    warm_up("resources")
+
+app = create_app(__name__)
 
 # Build multiple CRUD interfaces:
 
@@ -51,28 +74,55 @@ app = flask.Flask(__name__)
 def get_resource(resource_id=None):
     if resource_id is not None:
         # Retrieve a single document by its ID
-        document_snapshot = firestore.client().collection("resources").document(resource_id).get()
+        document_snapshot = db().collection("resources").document(resource_id).get(timeout=firestore_timeout())
         if document_snapshot.exists:
             document_data = document_snapshot.to_dict()
             document_data['resource_id'] = document_snapshot.id  # Add the document ID to the response
-            return document_data
+            return conditional_json(document_data)
         else:
             return {"error": "Document not found"}, 404
     else:
-        # Retrieve all documents in the collection, ordered by title
-        documents = firestore.client().collection("resources").order_by("title").get()
-        documents_list = []
-        for document in documents:
-            document_data = document.to_dict()
-            document_data['resource_id'] = document.id  # Add the document ID to each document's data
-            documents_list.append(document_data)
-        return documents_list
+        # Retrieve all documents in the collection (or a page), ordered by title
+        query = db().collection("resources").order_by("title")
+        documents, next_page_token = run_list_query(query, {"title": str})
+        return list_response(documents, resource_dict, next_page_token)
+
+
+@app.post("/resources:batchGet")
+def batch_get_resources():
+    """
+    Returns the resources with the given IDs in one Firestore round trip.
+    Body: {"ids": [...]}, at most BATCH_GET_MAX_IDS IDs.
+    """
+    data = flask.request.get_json(silent=True) or {}
+    ids = data.get("ids")
+    if (not isinstance(ids, list) or len(ids) > BATCH_GET_MAX_IDS
+            or not all(isinstance(i, str) and i and "/" not in i for i in ids)):
+        return jsonify({"error": f"ids must be a list of at most {BATCH_GET_MAX_IDS} document IDs"}), 400
+
+    ids = list(dict.fromkeys(ids))
+    collection = db().collection("resources")
+    snapshots = db().get_all(
+        [collection.document(i) for i in ids], timeout=firestore_timeout()
+    )
+    found = {}
+    for snapshot in snapshots:
+        if snapshot.exists:
+            document_data = snapshot.to_dict()
+            document_data["resource_id"] = snapshot.id
+            found[snapshot.id] = document_data
+    return conditional_json({
+        "resources": [found[i] for i in ids if i in found],
+        "missing": [i for i in ids if i not in found],
+    })
 
 @app.get("/resources/course/<course_id>")
 def list_resources_by_course_endpoint(course_id):
-    query = firestore.client().collection("resources").where("course_id", "==", course_id).get()
-    resources = [Resource.deserialize(doc) for doc in query if doc.exists]
-    return jsonify([asdict(resource) for resource in resources]), 200
+    query = db().collection("resources").where("course_id", "==", course_id)
+    documents, next_page_token = run_list_query(query, {})
+    # A projection returns just the fields asked for, not the whole Resource.
+    serialize = resource_dict if requested_fields() else lambda doc: asdict(Resource.deserialize(doc))
+    return list_response(documents, serialize, next_page_token)
 
 @app.post("/resources")
 def add_resource():
@@ -80,13 +130,13 @@ def add_resource():
     if not data:
          return jsonify({"error": "No data provided"}), 400
     
-    doc_ref = firestore.client().collection("resources").document()
-    write_result = doc_ref.set(data)  # This line actually writes the data to Firestore
+    doc_ref = db().collection("resources").document()
+    write_result = doc_ref.set(data, timeout=firestore_timeout())  # This line actually writes the data to Firestore
     return jsonify({"success": True, "doc_id": doc_ref.id}), 201
 
 @app.delete("/resources/<resource_id>")
 def delete_resource_endpoint(resource_id):
-    firestore.client().collection("resources").document(resource_id).delete()
+    db().collection("resources").document(resource_id).delete(timeout=firestore_timeout())
     return jsonify({"message": "Resource deleted"}), 200
 
 
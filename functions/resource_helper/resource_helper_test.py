@@ -0,0 +1,191 @@
+# Copyright 2018 Google LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Unit tests for the resource helper. Run from this directory.
+"""
+
+
+import pytest
+
+import helper_common
+import main
+
+
+class FakeDocument:
+    def __init__(self, id, data):
+        self.id = id
+        self.exists = True
+        self._data = data
+
+    def get(self, field):
+        return self._data[field]
+
+    def to_dict(self):
+        return dict(self._data)
+
+
+class FakeQuery:
+    """
+    The subset of a Firestore query used by the resource routes. Documents
+    are sorted by the order_by fields, "__name__" being the document ID.
+    """
+
+    def __init__(self, documents, order=()):
+        self.documents = documents
+        self.order = order
+
+    def _key(self, document):
+        return tuple(document.id if f == "__name__" else document.get(f) for f in self.order)
+
+    def where(self, field, op, value):
+        return FakeQuery([d for d in self.documents if d.get(field) == value], self.order)
+
+    def order_by(self, field):
+        order = self.order + (field,)
+        return FakeQuery(sorted(self.documents, key=FakeQuery(self.documents, order)._key), order)
+
+    def start_after(self, cursor):
+        after = tuple(cursor[f] for f in self.order)
+        return FakeQuery([d for d in self.documents if self._key(d) > after], self.order)
+
+    def limit(self, n):
+        return FakeQuery(self.documents[:n], self.order)
+
+    def select(self, fields):
+        return FakeQuery([FakeDocument(d.id, {k: v for k, v in d.to_dict().items() if k in fields})
+                          for d in self.documents], self.order)
+
+    def document(self, id):
+        for d in self.documents:
+            if d.id == id:
+                return d
+        missing = FakeDocument(id, {})
+        missing.exists = False
+        return missing
+
+    def get(self, timeout=None):
+        return list(self.documents)
+
+    stream = get
+
+
+class FakeClient:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def collection(self, name):
+        return FakeQuery(self.documents)
+
+    def get_all(self, references, timeout=None):
+        return references
+
+
+def make_resource(i):
+    return FakeDocument("r%02d" % i, {
+        "course_id": "c%d" % (i % 2), "title": "Resource %d" % (i // 3), "type": "video",
+        "url": "https://example.com/%d" % i, "description": "...", "uid": "u1",
+        "thumbnail": "t%d.png" % i,
+    })
+
+
+@pytest.fixture
+def client(monkeypatch):
+    documents = [make_resource(i) for i in range(9)]
+    monkeypatch.setattr(main, "db", lambda: FakeClient(documents))
+    return main.app.test_client()
+
+
+def walk(client, url):
+    """
+    Follows X-Next-Page-Token from url, returning the resources and the
+    number of pages.
+    """
+    seen, token, pages = [], None, 0
+    while True:
+        response = client.get(url + (f"&page_token={token}" if token else ""),
+                              headers={"Accept": "application/json"})
+        assert response.status_code == 200
+        seen += response.get_json()
+        pages += 1
+        token = response.headers.get(helper_common.NEXT_PAGE_TOKEN_HEADER)
+        if not token:
+            return seen, pages
+
+
+def test_resource_pages_follow_title_then_id(client):
+    """
+    Should walk every resource once, ordered by title and then document ID.
+    """
+    seen, pages = walk(client, "/resources?limit=4")
+    assert [r["resource_id"] for r in seen] == ["r%02d" % i for i in range(9)]
+    assert pages == 3
+
+
+def test_course_resource_pages_cover_the_course_once(client):
+    """
+    Should page through one course's resources in document ID order.
+    """
+    seen, pages = walk(client, "/resources/course/c1?limit=2")
+    assert [r["resource_id"] for r in seen] == ["r01", "r03", "r05", "r07"]
+    assert all(r["course_id"] == "c1" for r in seen)
+    assert pages == 2
+
+
+@pytest.mark.parametrize("url, cursor", [
+    ("/resources/course/c1", {"title": "Resource 0", "__name__": "r01"}),  # Not an order field here.
+    ("/resources/course/c1", {"__name__": ["r01"]}),                       # Not a document ID.
+    ("/resources", {"__name__": "r01"}),                                   # Missing order field.
+])
+def test_tampered_page_tokens_are_rejected(client, url, cursor):
+    """
+    Should answer 400 to a token that does not match the route's order fields.
+    """
+    token = helper_common.encode_page_token(cursor)
+    assert client.get(f"{url}?limit=2&page_token={token}").status_code == 400
+
+
+def test_projected_list_has_only_the_requested_fields(client):
+    """
+    Should return just ?fields= and the resource ID, on both list routes.
+    """
+    response = client.get("/resources/course/c0?fields=title,thumbnail")
+    assert response.get_json()[0] == {"resource_id": "r00", "title": "Resource 0",
+                                      "thumbnail": "t0.png"}
+    response = client.get("/resources?fields=title&limit=2")
+    assert [set(r) for r in response.get_json()] == [{"resource_id", "title"}] * 2
+
+
+def test_unprojected_course_list_returns_whole_resources(client):
+    """
+    Should return every Resource field without ?fields=.
+    """
+    resource = client.get("/resources/course/c0").get_json()[0]
+    assert resource["resource_id"] == resource["document_id"] == "r00"
+    assert resource["url"] == "https://example.com/0"
+
+
+def test_batch_get_returns_found_and_missing_ids(client):
+    """
+    Should return the found resources in request order and list the rest.
+    """
+    response = client.post("/resources:batchGet", json={"ids": ["r02", "gone", "r00", "r02"]})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert [r["resource_id"] for r in body["resources"]] == ["r02", "r00"]
+    assert body["missing"] == ["gone"]
+
+    ids = ["r%02d" % i for i in range(helper_common.BATCH_GET_MAX_IDS + 1)]
+    assert client.post("/resources:batchGet", json={"ids": ids}).status_code == 400
+    assert client.post("/resources:batchGet", json={"ids": ["a/b"]}).status_code == 400
@@ -0,0 +1,362 @@
+# Copyright 2018 Google LLC.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+"""
+The parts of course_helper and resource_helper that are not routes: wire
+encoding, deadlines, paged and projected list queries, NDJSON streaming and
+the lazily created Firestore client.
+
+Each function imports this module as a sibling of its main.py; the
+predeploy hook in firebase.json copies it into the function's directory.
+"""
+
+
+import base64
+import gzip
+import json
+import os
+import re
+import threading
+import time
+import zlib
+
+import flask
+from flask import jsonify
+from werkzeug.exceptions import HTTPException
+
+# Optional wire encodings, used only when installed and asked for.
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Small bodies are not worth the CPU of compressing them.
+MIN_COMPRESS_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Remaining time budget of the caller, in milliseconds.
+DEADLINE_HEADER = "X-Request-Deadline-Ms"
+
+# Upper bound on the IDs of one batch get, keeping requests and responses small.
+BATCH_GET_MAX_IDS = 100
+
+# Pagination of the list endpoints: ?limit=N&page_token=T.
+MAX_PAGE_SIZE = 500
+NEXT_PAGE_TOKEN_HEADER = "X-Next-Page-Token"
+
+# Projections of the list endpoints: ?fields=title,thumbnail.
+MAX_FIELDS = 32
+FIELD_NAME = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+# Streamed list responses (Accept: application/x-ndjson), see ndjson_response.
+NDJSON_MIMETYPE = "application/x-ndjson"
+STREAM_CHUNK_SIZE = 16 * 1024
+
+# Opt-in: open the Firestore client at instance start, see warm_up.
+WARM_UP_ON_START = os.environ.get("WARM_UP_ON_START", "").lower() in ("1", "true", "yes")
+WARM_UP_TIMEOUT = 10
+
+
+def conditional_json(data):
+    """
+    Serializes data for the client and answers 304 Not Modified when the
+    strong ETag (a hash of the encoded body) matches If-None-Match.
+
+    The body is MessagePack if the client prefers application/msgpack and
+    JSON otherwise, compressed with brotli or gzip per Accept-Encoding. The
+    encoding happens before the ETag is computed, so each representation
+    has its own validator.
+    """
+    request = flask.request
+    if msgpack is not None and request.accept_mimetypes.best_match(
+        ["application/json", "application/msgpack"]
+    ) == "application/msgpack":
+        body = msgpack.packb(data, use_bin_type=True)
+        mimetype = "application/msgpack"
+    else:
+        body = flask.json.dumps(data).encode("utf-8")
+        mimetype = "application/json"
+    response = flask.Response(body, mimetype=mimetype)
+
+    encodings = ["br", "gzip"] if brotli is not None else ["gzip"]
+    encoding = request.accept_encodings.best_match(encodings)
+    if encoding and len(body) >= MIN_COMPRESS_SIZE:
+        if encoding == "br":
+            response.set_data(brotli.compress(body, quality=BROTLI_QUALITY))
+        else:
+            response.set_data(gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0))
+        response.headers["Content-Encoding"] = encoding
+    response.vary.update(("Accept", "Accept-Encoding"))
+
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+def start_deadline():
+    """
+    Reads the caller's remaining time budget from the X-Request-Deadline-Ms
+    header. Work the caller has already given up on is not started.
+    """
+    flask.g.deadline = None
+    budget = flask.request.headers.get(DEADLINE_HEADER)
+    if budget is None:
+        return None
+    try:
+        budget_ms = int(budget)
+    except ValueError:
+        return None
+    if budget_ms <= 0:
+        return jsonify({"error": "Deadline exceeded"}), 504
+    flask.g.deadline = time.monotonic() + budget_ms / 1000
+
+
+def firestore_timeout():
+    """
+    Returns the timeout for a Firestore call: what is left of the caller's
+    budget, or None (the client default) without one. Aborts with 504 once
+    the budget is spent.
+    """
+    deadline = flask.g.get("deadline")
+    if deadline is None:
+        return None
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        flask.abort(504)
+    return remaining
+
+
+def encode_page_token(cursor):
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode().rstrip("=")
+
+
+def decode_page_token(token, order_fields):
+    """
+    Decodes a page token into a start_after cursor, checking that it has a
+    value of the right type (or null, which Firestore orders first) for
+    exactly the query's order fields and a document ID, so that a bad token
+    is a 400 and not an error in Firestore.
+
+    Parameters:
+       token (str): The token from ?page_token=.
+       order_fields (dict): The type of each order field, by field name.
+
+    Output:
+       The cursor dict. Raises ValueError if the token is invalid.
+    """
+    cursor = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    if not isinstance(cursor, dict) or set(cursor) != set(order_fields) | {"__name__"}:
+        raise ValueError("Invalid page token")
+    name = cursor["__name__"]
+    if not isinstance(name, str) or not name or "/" in name:
+        raise ValueError("Invalid page token")
+    for field, field_type in order_fields.items():
+        if cursor[field] is not None and not isinstance(cursor[field], field_type):
+            raise ValueError("Invalid page token")
+    return cursor
+
+
+def requested_fields():
+    """
+    Reads ?fields=a,b,c, the fields a list endpoint should return. The
+    document ID is always returned.
+
+    Output:
+       A list of field names, or None for every field.
+    """
+    value = flask.request.args.get("fields")
+    if not value:
+        return None
+    fields = list(dict.fromkeys(f for f in value.split(",") if f))
+    if len(fields) > MAX_FIELDS or not all(FIELD_NAME.fullmatch(f) for f in fields):
+        flask.abort(400, f"fields must be at most {MAX_FIELDS} comma-separated field names")
+    return fields
+
+
+def run_list_query(query, order_fields):
+    """
+    Runs a list query, or one page of it if ?limit= is given.
+
+    Pages are ordered by order_fields (a dict of their types by field name,
+    in order) and then by document ID, and ?page_token= continues after the
+    last document of the previous page with a Firestore start_after cursor.
+
+    With ?fields=, Firestore returns only those fields (and order_fields,
+    which the page cursor needs) through a select() projection.
+
+    Without ?limit=, NDJSON clients get Firestore's stream() iterator so that
+    documents are read as the response is written.
+
+    Output:
+       The document snapshots and the token of the next page (None on the
+       last page or without ?limit=).
+    """
+    args = flask.request.args
+    fields = requested_fields()
+    if fields is not None:
+        query = query.select(list(dict.fromkeys(fields + list(order_fields))))
+    if "limit" not in args:
+        if wants_ndjson():
+            return query.stream(timeout=firestore_timeout()), None
+        return query.get(timeout=firestore_timeout()), None
+    try:
+        limit = int(args["limit"])
+        cursor = (decode_page_token(args["page_token"], order_fields)
+                  if args.get("page_token") else None)
+    except (ValueError, TypeError):
+        flask.abort(400, "Invalid limit or page_token")
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        flask.abort(400, f"limit must be between 1 and {MAX_PAGE_SIZE}")
+
+    query = query.order_by("__name__")
+    if cursor is not None:
+        query = query.start_after(cursor)
+    # One extra document tells whether there is a next page.
+    documents = list(query.limit(limit + 1).get(timeout=firestore_timeout()))
+    if len(documents) <= limit:
+        return documents, None
+    documents = documents[:limit]
+    last = documents[-1]
+    cursor = {field: last.get(field) for field in order_fields}
+    cursor["__name__"] = last.id
+    return documents, encode_page_token(cursor)
+
+
+def wants_ndjson():
+    # Only clients that ask for NDJSON get it; */* keeps getting JSON.
+    return flask.request.accept_mimetypes.best_match(
+        ["application/json", NDJSON_MIMETYPE]
+    ) == NDJSON_MIMETYPE
+
+
+def ndjson_response(documents, serialize):
+    """
+    Streams documents as newline-delimited JSON, one object per line, as
+    they are read, so that memory stays flat however long the list is and
+    the first lines go out before the last document is read.
+
+    The stream is gzip-compressed if the client accepts it, flushing the
+    compressor after every chunk so that lines still go out as they are
+    read. There is no ETag: it would need the whole body up front.
+
+    The status line is sent before the first document is read: a failure
+    halfway through ends the stream early instead of becoming an error
+    response, and clients see a truncated list.
+    """
+    def generate():
+        chunk = []
+        size = 0
+        for document in documents:
+            line = flask.json.dumps(serialize(document)) + "\n"
+            chunk.append(line)
+            size += len(line)
+            if size >= STREAM_CHUNK_SIZE:
+                yield "".join(chunk).encode("utf-8")
+                chunk, size = [], 0
+        if chunk:
+            yield "".join(chunk).encode("utf-8")
+
+    def gzipped(chunks):
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for chunk in chunks:
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+
+    body = generate()
+    gzip_stream = flask.request.accept_encodings.best_match(["gzip"]) == "gzip"
+    if gzip_stream:
+        body = gzipped(body)
+    response = flask.Response(flask.stream_with_context(body), mimetype=NDJSON_MIMETYPE)
+    if gzip_stream:
+        response.headers["Content-Encoding"] = "gzip"
+    response.vary.update(("Accept", "Accept-Encoding"))
+    return response
+
+
+def list_response(documents, serialize, next_page_token=None):
+    # The body stays a plain list (or NDJSON stream); the next page is
+    # announced in a header.
+    if wants_ndjson():
+        response = ndjson_response(documents, serialize)
+    else:
+        response = conditional_json([serialize(document) for document in documents])
+    if next_page_token:
+        response.headers[NEXT_PAGE_TOKEN_HEADER] = next_page_token
+    return response
+
+
+_db = None
+_db_lock = threading.Lock()
+
+
+def db():
+    """
+    Returns the Firestore client of this instance. firebase_admin and the
+    Firestore client (gRPC) are imported and set up on first use, not at
+    module load, and the client is reused by every later invocation.
+    """
+    global _db
+    if _db is None:
+        with _db_lock:
+            if _db is None:
+                from firebase_admin import firestore, initialize_app
+                initialize_app()
+                _db = firestore.client()
+    return _db
+
+
+def warm_up(collection):
+    """
+    Creates the Firestore client and opens its channel with a one-document
+    read of collection, so that the first request pays for neither. Runs at
+    instance start when WARM_UP_ON_START is set; worth it with minimum
+    instances or startup CPU boost, where instance start is off the request
+    path.
+    """
+    try:
+        db().collection(collection).limit(1).get(timeout=WARM_UP_TIMEOUT)
+    except Exception as e:
+        # The first request sets the client up again if this failed.
+        print(f"Warm-up failed: {e}")
+
+
+def handle_deadline_exceeded(error):
+    """
+    Answers 504 to a Firestore call that ran out of firestore_timeout().
+    google.api_core is imported here, on the error path, rather than at
+    module load: like the Firestore client (see db()), it is not needed to
+    start the instance. Other errors are handled as without this handler.
+    """
+    if isinstance(error, HTTPException):
+        return error
+    from google.api_core.exceptions import DeadlineExceeded
+    if isinstance(error, DeadlineExceeded):
+        return jsonify({"error": "Deadline exceeded"}), 504
+    raise error
+
+
+def create_app(import_name):
+    """
+    Creates a function's Flask app, reading the caller's deadline before
+    each request and answering 504 to Firestore deadline errors.
+    """
+    app = flask.Flask(import_name)
+    app.before_request(start_deadline)
+    app.register_error_handler(Exception, handle_deadline_exceeded)
+    return app
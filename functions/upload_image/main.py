@@ -19,19 +19,60 @@ Cloud Function for processing uploaded images/pdf.
 
 
 import os
+import threading
+import time
 import uuid
 
-from google.cloud import storage
-from wand.image import Image
 from flask import jsonify, escape
 
-client = storage.Client()
+# google.cloud.storage and wand (ImageMagick) are imported on first use:
+# OPTIONS preflights and PDF uploads never need wand.
+_client = None
+_client_lock = threading.Lock()
 
 BUCKET = os.environ.get('GCS_BUCKET')
 IMAGE_FILENAME_TEMPLATE = '{}.png'
 PDF_FILENAME_TEMPLATE = '{}.pdf'
 EXPECTED_WIDTH = 640
 EXPECTED_HEIGHT = 640
+UPLOAD_TIMEOUT = 60
+
+# Remaining time budget of the caller, in milliseconds.
+DEADLINE_HEADER = 'X-Request-Deadline-Ms'
+
+# Opt-in: set up the storage client and wand at instance start, see warm_up.
+WARM_UP_ON_START = os.environ.get('WARM_UP_ON_START', '').lower() in ('1', 'true', 'yes')
+
+
+def storage_client():
+    """
+    Returns the Cloud Storage client of this instance, created on first use
+    and reused by every later invocation.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from google.cloud import storage
+                _client = storage.Client()
+    return _client
+
+
+def warm_up():
+    """
+    Imports wand and creates the storage client, so that the first upload
+    pays for neither. Runs at instance start when WARM_UP_ON_START is set.
+    """
+    try:
+        import wand.image  # noqa: F401
+        storage_client()
+    except Exception as e:
+        print(f'Warm-up failed: {e}')
+
+
+if WARM_UP_ON_START:
+    warm_up()
+
 
 def upload_image(request):
     # Set up CORS to allow requests from arbitrary origins.
@@ -52,6 +93,20 @@ def upload_image(request):
         'Access-Control-Allow-Origin': '*'
     }
 
+    # Skip the conversion and upload if the caller has already given up.
+    # A malformed budget is ignored, as by start_deadline in the helpers.
+    deadline = None
+    budget = request.headers.get(DEADLINE_HEADER)
+    if budget is not None:
+        try:
+            budget_ms = int(budget)
+        except ValueError:
+            budget_ms = None
+        if budget_ms is not None:
+            if budget_ms <= 0:
+                return ("Deadline exceeded.", 504, headers)
+            deadline = time.monotonic() + budget_ms / 1000
+
     file = request.files.get('filepond')
     if not file:
         return ("File is not found in the request.", 400, headers)
@@ -62,6 +117,7 @@ def upload_image(request):
     original_filename = escape(file.filename)
 
     if content_type.startswith('image/'):
+        from wand.image import Image
         with Image(blob=file_content) as image:
             image.transform(resize="{}x{}>".format(EXPECTED_WIDTH, EXPECTED_HEIGHT))
             image.extent(
@@ -81,13 +137,19 @@ def upload_image(request):
         return ("Unsupported file type.", 400, headers)
     
 
-    bucket = client.get_bucket(BUCKET)
+    timeout = UPLOAD_TIMEOUT
+    if deadline is not None:
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            return ("Deadline exceeded.", 504, headers)
+
+    bucket = storage_client().get_bucket(BUCKET, timeout=timeout)
     blob = bucket.blob(filename)
-    blob.upload_from_string(converted_content, content_type=content_type)
+    blob.upload_from_string(converted_content, content_type=content_type, timeout=timeout)
     
     # Set the Content-Disposition header
     blob.content_disposition = content_disposition
-    blob.patch()
+    blob.patch(timeout=timeout)
     
     public_url = f'https://storage.googleapis.com/{BUCKET}/{filename}'
 